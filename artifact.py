@@ -0,0 +1,216 @@
+# Bulk artifacts
+#
+# An artifact holds the complete _bulk stream of an index build, so the
+# documents can be parsed once (main.py hugo --export) and loaded into
+# one or more clusters later, without cloning again (main.py load).
+#
+# The format is NDJSON, compressed according to the file name suffix:
+# .zst (zstd, needs Python 3.14), .gz (gzip), otherwise uncompressed.
+#
+# - The first line is a header with the index to create:
+#   {"format": "docs-indexer-bulk", "version": 1, "indexer": ..., "alias": ...,
+#    "index": ..., "sha": ..., "created": ..., "settings": ..., "mappings": ...}
+# - Then each document as in a _bulk request body: an action line, e. g.
+#   {"index": {"_index": ..., "_id": ...}}, followed by the source line.
+# - The last line is {"end": {"documents": <number of documents>}}, so a
+#   truncated artifact is detected before its index goes live.
+#
+# Artifacts are written and read line by line, so memory use doesn't grow
+# with their size.
+#
+# load() creates the index from the header, writes the documents with
+# parallel _bulk requests and points the alias to the index.
+
+import gzip
+import json
+import logging
+import os
+import sys
+
+from opensearchpy import OpenSearch
+from opensearchpy.helpers.actions import expand_action
+from opensearchpy.serializer import JSONSerializer
+
+import metrics
+from common import bulk_index
+from common import build_index_settings
+from common import finish_index_build
+from common import swap_alias
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+
+# Number of _bulk requests in flight while loading an artifact
+LOAD_THREAD_COUNT = int(os.getenv("LOAD_THREAD_COUNT", "4"))
+
+ARTIFACT_FORMAT = "docs-indexer-bulk"
+ARTIFACT_VERSION = 1
+
+_serializer = JSONSerializer()
+
+
+def open_artifact(path, mode):
+    """
+    Opens an artifact file for reading ("rt") or writing ("wt") text,
+    compressed according to its suffix
+    """
+    if path.endswith(".zst"):
+        if zstd is None:
+            raise ValueError(f'{path}: zstd compression needs Python 3.14 or later, use .gz instead')
+        return zstd.open(path, mode, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+
+def write_artifact(path, header, actions):
+    """
+    Writes an artifact with the given header fields (see above) and bulk
+    actions, as passed to common.bulk_index. The file is replaced
+    atomically once complete. Returns the number of documents written.
+    """
+    header = {"format": ARTIFACT_FORMAT, "version": ARTIFACT_VERSION, **header}
+    tmp_path = f'{path}.{os.getpid()}.tmp{os.path.splitext(path)[1]}'
+    count = 0
+    try:
+        with open_artifact(tmp_path, "wt") as f:
+            f.write(_serializer.dumps(header) + "\n")
+            for action in actions:
+                meta, source = expand_action(action)
+                f.write(_serializer.dumps(meta) + "\n")
+                if source is not None:
+                    f.write(_serializer.dumps(source) + "\n")
+                count += 1
+            f.write(_serializer.dumps({"end": {"documents": count}}) + "\n")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logging.info(f'Wrote {count} documents to {path}')
+    return count
+
+
+def read_header(path):
+    """
+    Returns the header of an artifact. Raises ValueError if the file is
+    not an artifact of a supported version.
+    """
+    with open_artifact(path, "rt") as f:
+        return _parse_header(path, f.readline())
+
+
+def read_actions(path):
+    """
+    Yields the actions of an artifact as tuples (action, source), with the
+    action a dict and the source the serialized JSON (None for deletes),
+    for common.bulk_index with expand_action=expand_raw_action. Raises
+    ValueError at the end if the artifact is truncated.
+    """
+    count = 0
+    with open_artifact(path, "rt") as f:
+        _parse_header(path, f.readline())
+        try:
+            while line := f.readline():
+                meta = json.loads(line)
+                if "end" in meta:
+                    if meta["end"]["documents"] != count:
+                        raise ValueError(f'{path}: expected {meta["end"]["documents"]} documents, found {count}')
+                    return
+                source = None
+                if "delete" not in meta:
+                    source = f.readline().rstrip("\n")
+                    if not source:
+                        break
+                count += 1
+                yield (meta, source)
+        except EOFError:
+            # compressed stream ends early
+            pass
+    raise ValueError(f'{path}: artifact is truncated after {count} documents')
+
+
+def expand_raw_action(item):
+    """
+    expand_action_callback for the opensearchpy bulk helpers, for the
+    (action, source) tuples from read_actions
+    """
+    return item
+
+
+def _parse_header(path, line):
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f'{path} is not a bulk artifact')
+    if header.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f'{path}: unsupported artifact version {header.get("version")}')
+    return header
+
+
+def load(es, path, thread_count=None):
+    """
+    Loads the artifact at path into the index named in its header and
+    points the alias to it. Returns True if the index was loaded, None if
+    it exists already and False if the artifact is truncated (the partial
+    index is deleted then).
+    """
+    header = read_header(path)
+    index_name = header["index"]
+    if es.indices.exists(index=index_name):
+        logging.info(f'Index {index_name} already exists.')
+        return None
+
+    logging.info(f'Loading {header["indexer"]} artifact {path} of {header["sha"]} into {index_name}')
+    es.indices.create(
+        index=index_name,
+        body={
+            "settings": build_index_settings(header["settings"]),
+            "mappings": header["mappings"],
+        })
+    try:
+        with metrics.stage("index"):
+            success, failed = bulk_index(es, read_actions(path), thread_count=thread_count or LOAD_THREAD_COUNT,
+                                         expand_action=expand_raw_action)
+    except ValueError as e:
+        logging.error(f'{e}, deleting index {index_name}')
+        es.indices.delete(index=index_name)
+        return False
+    metrics.inc("documents_indexed", success)
+    metrics.inc("documents_failed", failed)
+    logging.info(f'Indexed {success} documents, {failed} failed')
+
+    with metrics.stage("finish"):
+        finish_index_build(es, index_name)
+    with metrics.stage("alias"):
+        swap_alias(es, header["alias"], index_name)
+    return True
+
+
+def run(path, thread_count=None):
+    """
+    Main function of main.py load
+    """
+    if OPENSEARCH_ENDPOINT is None:
+        logging.error("OPENSEARCH_ENDPOINT isn't configured.")
+        sys.exit(1)
+    try:
+        header = read_header(path)
+    except (OSError, ValueError) as e:
+        logging.error(f'Could not read artifact: {e}')
+        sys.exit(1)
+    metrics.start(f'{header["indexer"]}-load')
+
+    # one connection per bulk request in flight
+    thread_count = thread_count or LOAD_THREAD_COUNT
+    es = OpenSearch(hosts=[OPENSEARCH_ENDPOINT], maxsize=thread_count)
+    result = load(es, path, thread_count)
+    if result is False:
+        sys.exit(1)
+    if result:
+        metrics.current().export()
@@ -0,0 +1,180 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from opensearchpy import OpenSearch
+
+import artifact
+
+HEADER = {
+    "indexer": "hugo",
+    "alias": "docs",
+    "index": "docs-abc123",
+    "sha": "abc123",
+    "created": "2026-01-01T00:00:00",
+    "settings": {"index": {"number_of_shards": 1}},
+    "mappings": {"properties": {"title": {"type": "text"}}},
+}
+
+
+def actions(count):
+    for i in range(count):
+        yield {"_index": "docs-abc123", "_id": f'/page-{i}/', "_source": {"title": f'Page {i}', "uri": f'/page-{i}/'}}
+
+
+class TestArtifact(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def assert_round_trip(self, name):
+        path = os.path.join(self.tmpdir, name)
+        self.assertEqual(artifact.write_artifact(path, HEADER, actions(3)), 3)
+        self.assertEqual(os.listdir(self.tmpdir), [name])
+
+        header = artifact.read_header(path)
+        self.assertEqual(header["format"], "docs-indexer-bulk")
+        self.assertEqual(header["mappings"], HEADER["mappings"])
+
+        items = list(artifact.read_actions(path))
+        self.assertEqual(len(items), 3)
+        meta, source = items[1]
+        self.assertEqual(meta, {"index": {"_index": "docs-abc123", "_id": "/page-1/"}})
+        self.assertEqual(json.loads(source), {"title": "Page 1", "uri": "/page-1/"})
+        self.assertIs(artifact.expand_raw_action(items[1]), items[1])
+
+    def test_plain(self):
+        self.assert_round_trip("docs.ndjson")
+
+    def test_gzip(self):
+        self.assert_round_trip("docs.ndjson.gz")
+        with gzip.open(os.path.join(self.tmpdir, "docs.ndjson.gz"), "rt") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1 + 2 * 3 + 1)
+        self.assertEqual(json.loads(lines[-1]), {"end": {"documents": 3}})
+
+    @unittest.skipUnless(artifact.zstd, "compression.zstd needs Python 3.14")
+    def test_zstd(self):
+        self.assert_round_trip("docs.ndjson.zst")
+
+    @unittest.skipIf(artifact.zstd, "compression.zstd is available")
+    def test_zstd_unavailable(self):
+        with self.assertRaises(ValueError):
+            artifact.write_artifact(os.path.join(self.tmpdir, "docs.ndjson.zst"), HEADER, actions(1))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_failed_write_keeps_previous_artifact(self):
+        path = os.path.join(self.tmpdir, "docs.ndjson.gz")
+        artifact.write_artifact(path, HEADER, actions(2))
+
+        def failing():
+            yield from actions(1)
+            raise RuntimeError("parse failed")
+        with self.assertRaises(RuntimeError):
+            artifact.write_artifact(path, HEADER, failing())
+
+        self.assertEqual(os.listdir(self.tmpdir), ["docs.ndjson.gz"])
+        self.assertEqual(len(list(artifact.read_actions(path))), 2)
+
+    def test_truncated(self):
+        path = os.path.join(self.tmpdir, "docs.ndjson")
+        artifact.write_artifact(path, HEADER, actions(3))
+        with open(path) as f:
+            lines = f.readlines()
+
+        for cut in (len(lines) - 1, len(lines) - 2):
+            with open(path, "w") as f:
+                f.writelines(lines[:cut])
+            with self.subTest(lines=cut), self.assertRaisesRegex(ValueError, "truncated"):
+                list(artifact.read_actions(path))
+
+    def test_truncated_gzip(self):
+        path = os.path.join(self.tmpdir, "docs.ndjson.gz")
+        artifact.write_artifact(path, HEADER, actions(50))
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            list(artifact.read_actions(path))
+
+    def test_invalid_header(self):
+        path = os.path.join(self.tmpdir, "docs.ndjson")
+        for first_line in ("", "not json", '{"index": {}}', '{"format": "docs-indexer-bulk", "version": 99}'):
+            with open(path, "w") as f:
+                f.write(first_line + "\n")
+            with self.subTest(first_line=first_line), self.assertRaises(ValueError):
+                artifact.read_header(path)
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "docs.ndjson.gz")
+        artifact.write_artifact(self.path, HEADER, actions(5))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _bulk_response(self, body, **kwargs):
+        lines = body.splitlines() if isinstance(body, str) else body.decode().splitlines()
+        self.loaded.extend(json.loads(line)["title"] for line in lines[1::2])
+        items = [{"index": {"_id": json.loads(line)["index"]["_id"], "status": 201}} for line in lines[::2]]
+        return {"errors": False, "items": items}
+
+    def _load(self, path, exists=False):
+        self.loaded = []
+        es = OpenSearch(hosts=["http://localhost:9200"])
+        with mock.patch.object(es, "bulk", side_effect=self._bulk_response), \
+                mock.patch.object(es, "indices") as indices, \
+                mock.patch("artifact.finish_index_build") as finish, \
+                mock.patch("artifact.swap_alias") as swap:
+            indices.exists.return_value = exists
+            result = artifact.load(es, path, thread_count=2)
+        return result, indices, finish, swap
+
+    def test_load(self):
+        with mock.patch("common.INDEX_BUILD_TUNING", True):
+            result, indices, finish, swap = self._load(self.path)
+
+        self.assertTrue(result)
+        self.assertEqual(sorted(self.loaded), [f'Page {i}' for i in range(5)])
+        body = indices.create.call_args.kwargs["body"]
+        self.assertEqual(indices.create.call_args.kwargs["index"], "docs-abc123")
+        self.assertEqual(body["mappings"], HEADER["mappings"])
+        self.assertEqual(body["settings"]["index"]["number_of_shards"], 1)
+        self.assertEqual(body["settings"]["index"]["refresh_interval"], "-1")
+        finish.assert_called_once()
+        self.assertEqual(swap.call_args.args[1:], ("docs", "docs-abc123"))
+
+    def test_existing_index(self):
+        result, indices, finish, swap = self._load(self.path, exists=True)
+        self.assertIsNone(result)
+        indices.create.assert_not_called()
+        swap.assert_not_called()
+
+    def test_truncated_is_not_made_live(self):
+        with gzip.open(self.path, "rt") as f:
+            lines = f.readlines()
+        with gzip.open(self.path, "wt") as f:
+            f.writelines(lines[:-1])
+
+        with self.assertLogs(level="ERROR") as logs:
+            result, indices, finish, swap = self._load(self.path)
+
+        self.assertIs(result, False)
+        self.assertIn("truncated", logs.output[0])
+        indices.delete.assert_called_once_with(index="docs-abc123")
+        swap.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
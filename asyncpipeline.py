@@ -0,0 +1,143 @@
+# Asynchronous indexing pipeline
+#
+# The default (sync) indexing path reads, parses and writes documents in one
+# thread, so waiting for OpenSearch and parsing never overlap. With
+# PIPELINE_MODE=async (see common.py), three stages run concurrently on an
+# asyncio event loop, connected by bounded queues:
+#
+# - source: iterates the items to index (e. g. files or Hubspot posts) in a
+#   thread, as this may block on disk or network I/O
+# - parse: turns items into bulk actions, with PIPELINE_PARSE_TASKS items
+#   in progress at the same time (e. g. in a process pool)
+# - write: sends the actions to OpenSearch in _bulk requests, with
+#   PIPELINE_BULK_TASKS requests in flight at the same time
+#
+# When a queue is full (PIPELINE_QUEUE_SIZE items), the stage before it
+# waits. This requires opensearch-py's async support (aiohttp).
+
+import asyncio
+import logging
+import os
+import threading
+
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.helpers import async_streaming_bulk
+
+from common import BULK_CHUNK_SIZE
+from common import BULK_MAX_CHUNK_BYTES
+from common import bulk_result_ok
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+PIPELINE_PARSE_TASKS = int(os.getenv("PIPELINE_PARSE_TASKS", "0"))
+PIPELINE_BULK_TASKS = int(os.getenv("PIPELINE_BULK_TASKS", "2"))
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+
+def index(endpoint, items, parse, label="document", parse_tasks=None, bulk_tasks=None, queue_size=None):
+    """
+    Runs the pipeline to completion and returns a tuple (number of
+    successful actions, number of failed actions), like common.bulk_index.
+
+    endpoint:    OpenSearch URL
+    items:       iterable of items to index, consumed in a thread
+    parse:       coroutine function turning an item into a bulk action,
+                 a list of bulk actions, or None to skip the item
+    label:       what a document is called in error messages (e. g. "page")
+    parse_tasks: number of items parsed concurrently. Defaults to
+                 PIPELINE_PARSE_TASKS, or 1.
+    """
+    async def main():
+        es = AsyncOpenSearch(hosts=[endpoint])
+        try:
+            return await run_pipeline(es, items, parse, label,
+                                      parse_tasks=parse_tasks, bulk_tasks=bulk_tasks, queue_size=queue_size)
+        finally:
+            await es.close()
+
+    return asyncio.run(main())
+
+
+async def run_pipeline(es, items, parse, label="document", parse_tasks=None, bulk_tasks=None, queue_size=None):
+    """
+    Like index, but runs on the current event loop with the given
+    opensearchpy.AsyncOpenSearch client.
+    """
+    parse_tasks = parse_tasks or PIPELINE_PARSE_TASKS or 1
+    bulk_tasks = bulk_tasks or PIPELINE_BULK_TASKS
+    queue_size = queue_size or PIPELINE_QUEUE_SIZE
+
+    item_queue = asyncio.Queue(maxsize=queue_size)
+    action_queue = asyncio.Queue(maxsize=queue_size)
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+
+    async def source():
+        await loop.run_in_executor(None, _produce, items, item_queue, loop, stop)
+        for _ in range(parse_tasks):
+            await item_queue.put(_DONE)
+
+    async def parse_stage():
+        while (item := await item_queue.get()) is not _DONE:
+            action = await parse(item)
+            if isinstance(action, list):
+                for one in action:
+                    await action_queue.put(one)
+            elif action is not None:
+                await action_queue.put(action)
+
+    async def parse_all():
+        async with asyncio.TaskGroup() as group:
+            for _ in range(parse_tasks):
+                group.create_task(parse_stage())
+        for _ in range(bulk_tasks):
+            await action_queue.put(_DONE)
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(source())
+            group.create_task(parse_all())
+            writers = [group.create_task(_write(es, action_queue, label)) for _ in range(bulk_tasks)]
+    finally:
+        # If a stage failed, let the source thread finish: it may be
+        # waiting to put another item into the full queue.
+        stop.set()
+        while not item_queue.empty():
+            item_queue.get_nowait()
+
+    results = [writer.result() for writer in writers]
+    return (sum(r[0] for r in results), sum(r[1] for r in results))
+
+
+def _produce(items, queue, loop, stop):
+    """
+    Puts all items into the asyncio queue from a thread, waiting while it
+    is full. Returns early once stop is set.
+    """
+    for item in items:
+        if stop.is_set():
+            return
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+
+async def _write(es, queue, label):
+    async def actions():
+        while (action := await queue.get()) is not _DONE:
+            yield action
+
+    success = 0
+    failed = 0
+    results = async_streaming_bulk(
+        es, actions(),
+        chunk_size=BULK_CHUNK_SIZE,
+        max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+        raise_on_error=False,
+        raise_on_exception=False)
+    async for ok, item in results:
+        if bulk_result_ok(ok, item, label):
+            success += 1
+        else:
+            failed += 1
+    logging.debug(f'Bulk writer finished: {success} successful, {failed} failed')
+    return (success, failed)
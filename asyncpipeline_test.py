@@ -0,0 +1,85 @@
+import asyncio
+import importlib.util
+import json
+import unittest
+from unittest import mock
+
+HAS_ASYNC = importlib.util.find_spec("aiohttp") is not None
+if HAS_ASYNC:
+    from opensearchpy import AsyncOpenSearch
+    import asyncpipeline
+
+
+@unittest.skipUnless(HAS_ASYNC, "aiohttp is not installed")
+class TestRunPipeline(unittest.TestCase):
+
+    async def _bulk_response(self, body, **kwargs):
+        """Fake _bulk endpoint: every document with id 'bad' is rejected."""
+        items = []
+        for line in body.splitlines()[::2]:
+            doc_id = json.loads(line)["index"]["_id"]
+            if doc_id == "bad":
+                items.append({"index": {"_id": doc_id, "status": 400, "error": "mapper_parsing_exception"}})
+            else:
+                items.append({"index": {"_id": doc_id, "status": 201}})
+        return {"errors": any(i["index"]["status"] >= 300 for i in items), "items": items}
+
+    async def _parse(self, item):
+        await asyncio.sleep(0)
+        if item == "skip":
+            return None
+        return {"_index": "test", "_id": item, "_source": {"title": item}}
+
+    def test_parses_writes_and_reports_failures(self):
+        items = ["a", "bad", "skip"] + [f'doc{i}' for i in range(20)]
+
+        async def main():
+            es = AsyncOpenSearch(hosts=["http://localhost:9200"])
+            try:
+                with mock.patch.object(es, "bulk", side_effect=self._bulk_response) as bulk:
+                    result = await asyncpipeline.run_pipeline(
+                        es, iter(items), self._parse, label="page",
+                        parse_tasks=3, bulk_tasks=2, queue_size=2)
+                return result, bulk.call_count
+            finally:
+                await es.close()
+
+        with mock.patch("asyncpipeline.BULK_CHUNK_SIZE", 5):
+            with self.assertLogs(level="ERROR") as logs:
+                (result, call_count) = asyncio.run(main())
+
+        self.assertEqual(result, (21, 1))
+        self.assertGreaterEqual(call_count, 5)
+        self.assertIn("Error when indexing page bad: mapper_parsing_exception", logs.output[0])
+
+    def test_parse_may_return_several_actions(self):
+        async def parse(item):
+            return [{"_index": "test", "_id": f'{item}-{i}', "_source": {}} for i in range(3)]
+
+        async def main():
+            es = AsyncOpenSearch(hosts=["http://localhost:9200"])
+            try:
+                with mock.patch.object(es, "bulk", side_effect=self._bulk_response):
+                    return await asyncpipeline.run_pipeline(es, iter(["a", "b"]), parse)
+            finally:
+                await es.close()
+
+        self.assertEqual(asyncio.run(main()), (6, 0))
+
+    def test_parse_error_stops_pipeline(self):
+        async def parse(item):
+            raise ValueError(item)
+
+        async def main():
+            es = AsyncOpenSearch(hosts=["http://localhost:9200"])
+            try:
+                return await asyncpipeline.run_pipeline(es, iter(range(1000)), parse, queue_size=2)
+            finally:
+                await es.close()
+
+        with self.assertRaises(ExceptionGroup):
+            asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
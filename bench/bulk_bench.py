@@ -0,0 +1,64 @@
+"""
+Compares indexing throughput of one es.index() call per document with the
+bulk writer in common.bulk_index, against the fake OpenSearch server.
+
+Usage:
+
+    python -m bench.bulk_bench [--docs 2000] [--latency 0.002]
+"""
+
+import argparse
+import time
+
+from opensearchpy import OpenSearch
+
+from bench.fake_opensearch import FakeOpenSearch
+from common import bulk_index
+
+
+def make_docs(count):
+    for i in range(count):
+        body = f'Paragraph number {i} with some words to index. ' * 40
+        yield f'/page-{i}/', {
+            "title": f'Page {i}',
+            "uri": f'/page-{i}/',
+            "body": body,
+            "text": f'Page {i} {body}',
+        }
+
+
+def per_document(es, index, count):
+    for doc_id, doc in make_docs(count):
+        es.index(index=index, id=doc_id, body=doc)
+
+
+def bulk(es, index, count, **kwargs):
+    actions = ({"_index": index, "_id": doc_id, "_source": doc} for doc_id, doc in make_docs(count))
+    bulk_index(es, actions, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="Simulated round trip time per request in seconds")
+    args = parser.parse_args()
+
+    variants = [
+        ("es.index per document", lambda es: per_document(es, "bench-single", args.docs)),
+        ("bulk_index, streaming", lambda es: bulk(es, "bench-bulk", args.docs, thread_count=1)),
+        ("bulk_index, 4 threads", lambda es: bulk(es, "bench-parallel", args.docs, thread_count=4, chunk_size=100)),
+    ]
+
+    print(f'{args.docs} documents, {args.latency * 1000:.1f} ms simulated latency per request')
+    with FakeOpenSearch(latency=args.latency) as server:
+        es = OpenSearch(hosts=[server.url])
+        for name, fn in variants:
+            start = time.perf_counter()
+            fn(es)
+            elapsed = time.perf_counter() - start
+            print(f'{name:<24} {elapsed:8.2f} s {args.docs / elapsed:10.0f} docs/s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+A minimal in-process stand-in for the OpenSearch HTTP API, for benchmarks.
+
+It understands just enough of the API for the indexers to run against it:
+index creation and existence checks, single document writes, _bulk requests,
+_reindex, aliases, settings updates, refresh and force merge. Documents are
+kept in memory. An artificial per-request latency can be configured to
+simulate the network round trip to a real cluster.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import fnmatch
+import json
+import socket
+import threading
+import time
+
+
+class FakeOpenSearch:
+    """
+    Runs the fake server in a background thread. Use as a context manager:
+
+        with FakeOpenSearch(latency=0.002) as server:
+            es = OpenSearch(hosts=[server.url])
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.indices = {}
+        self.aliases = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler_class(self))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}/'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _handler_class(server):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # avoid delayed ACK stalls between the header and body writes
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _reply(self, status, payload=None):
+            data = b"" if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        def _dispatch(self):
+            if server.latency:
+                time.sleep(server.latency)
+            body = self._body()
+            parts = [p for p in urlparse(self.path).path.split("/") if p]
+            with server.lock:
+                server.requests += 1
+                status, payload = route(self.command, parts, body)
+            self._reply(status, payload)
+
+        do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = _dispatch
+
+    def resolve(name):
+        if name in server.aliases:
+            return sorted(server.aliases[name])
+        return [name] if name in server.indices else []
+
+    def index_doc(index, doc_id, source):
+        docs = server.indices.setdefault(index, {"docs": {}, "body": {}, "created": time.time_ns() // 1000})["docs"]
+        result = "updated" if doc_id in docs else "created"
+        docs[doc_id] = source
+        return result
+
+    def route(method, parts, body):
+        if parts and parts[-1] == "_bulk":
+            return bulk(parts[0] if len(parts) > 1 else None, body)
+        if parts == ["_reindex"] and method == "POST":
+            spec = json.loads(body)
+            docs = server.indices[spec["source"]["index"]]["docs"]
+            for doc_id, source in docs.items():
+                index_doc(spec["dest"]["index"], doc_id, source)
+            return 200, {"total": len(docs), "created": len(docs), "failures": []}
+        if parts == ["_aliases"] and method == "POST":
+            for action in json.loads(body)["actions"]:
+                (op, spec), = action.items()
+                if op == "add":
+                    server.aliases.setdefault(spec["alias"], set()).add(spec["index"])
+                elif op == "remove":
+                    server.aliases.get(spec["alias"], set()).discard(spec["index"])
+            return 200, {"acknowledged": True}
+        if len(parts) == 2 and parts[0] == "_alias":
+            indices = resolve(parts[1]) if parts[1] in server.aliases else []
+            if not indices:
+                return 404, {"error": "alias missing", "status": 404}
+            return 200, {i: {"aliases": {parts[1]: {}}} for i in indices}
+        if len(parts) == 3 and parts[1] == "_alias":
+            if method == "PUT":
+                server.aliases.setdefault(parts[2], set()).add(parts[0])
+                return 200, {"acknowledged": True}
+            if method == "DELETE":
+                server.aliases.get(parts[2], set()).discard(parts[0])
+                return 200, {"acknowledged": True}
+        if len(parts) == 3 and parts[1] == "_doc":
+            result = index_doc(parts[0], parts[2], json.loads(body))
+            return 201, {"_index": parts[0], "_id": parts[2], "result": result}
+        if len(parts) == 2 and parts[1] in ("_refresh", "_forcemerge") and method == "POST":
+            server.indices[parts[0]][parts[1]] = server.indices[parts[0]].get(parts[1], 0) + 1
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        if len(parts) >= 2 and parts[1] == "_settings" and method == "GET":
+            pattern = parts[0]
+            names = [n for n in server.indices if fnmatch.fnmatchcase(n, pattern)] if "*" in pattern else resolve(pattern)
+            return 200, {n: {"settings": {"index": {"creation_date": str(server.indices[n]["created"])}}} for n in names}
+        if len(parts) == 2 and parts[1] == "_settings" and method == "PUT":
+            settings = server.indices[parts[0]]["body"].setdefault("settings", {}).setdefault("index", {})
+            settings.update(json.loads(body)["index"])
+            return 200, {"acknowledged": True}
+        if len(parts) == 1:
+            name = parts[0]
+            if method == "HEAD":
+                return (200 if resolve(name) else 404), None
+            if method == "PUT":
+                server.indices[name] = {"docs": {}, "body": json.loads(body or b"{}"), "created": time.time_ns() // 1000}
+                return 200, {"acknowledged": True, "index": name}
+            if method == "DELETE":
+                server.indices.pop(name, None)
+                for members in server.aliases.values():
+                    members.discard(name)
+                return 200, {"acknowledged": True}
+        return 400, {"error": f"unsupported request {method} /{'/'.join(parts)}", "status": 400}
+
+    def bulk(default_index, body):
+        lines = body.decode().splitlines()
+        items = []
+        i = 0
+        while i < len(lines):
+            (op, meta), = json.loads(lines[i]).items()
+            index = meta.get("_index", default_index)
+            if op == "delete":
+                server.indices.get(index, {"docs": {}})["docs"].pop(meta["_id"], None)
+                items.append({op: {"_index": index, "_id": meta["_id"], "status": 200}})
+                i += 1
+                continue
+            result = index_doc(index, meta["_id"], json.loads(lines[i + 1]))
+            items.append({op: {"_index": index, "_id": meta["_id"], "status": 201, "result": result}})
+            i += 2
+        return 200, {"took": 1, "errors": False, "items": items}
+
+    return Handler
@@ -0,0 +1,62 @@
+"""
+Microbenchmark of front matter extraction on long pages: the previous
+approach (finding all "---" lines in the page with a regular expression)
+versus read_front_matter, which only scans the front matter. The pages
+contain horizontal rules, which the previous approach also matched.
+Reports per document timings, without the Markdown conversion.
+
+Usage:
+
+    python -m bench.front_matter_bench [--docs 100] [--sections 200] [--repeat 3]
+"""
+
+import argparse
+import random
+import re
+import statistics
+import time
+
+import yaml
+
+from bench.synthetic import page_source
+from hugo import Loader, read_front_matter
+
+
+def regex_front_matter(source_text):
+    matches = list(re.finditer(r"(---)\n", source_text))
+    if len(matches) < 2:
+        return None
+    front_matter_start = matches[0].start(1)
+    front_matter_end = matches[1].start(1)
+    data = yaml.load(source_text[(front_matter_start + 3):front_matter_end], Loader=Loader)
+    return (data, source_text[(front_matter_end + 3):])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    docs = [page_source(rnd, i, sections=args.sections).replace("\n## ", "\n---\n\n## ")
+            for i in range(args.docs)]
+    size = sum(len(d) for d in docs) / len(docs)
+    print(f'{args.docs} documents, {size / 1024:.1f} KB Markdown on average')
+
+    for name, func in (("regex", regex_front_matter), ("anchored", read_front_matter)):
+        timings = []
+        for _ in range(args.repeat):
+            for doc in docs:
+                start = time.perf_counter()
+                func(doc)
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f'{name:<10} mean {statistics.mean(timings) * 1000:7.3f} ms'
+              f'  median {statistics.median(timings) * 1000:7.3f} ms'
+              f'  p95 {timings[int(len(timings) * 0.95)] * 1000:7.3f} ms')
+
+
+if __name__ == "__main__":
+    main()
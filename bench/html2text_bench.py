@@ -0,0 +1,53 @@
+"""
+Microbenchmark of the html2text engines, on HTML rendered from synthetic
+HUGO pages. Reports per document timings.
+
+Usage:
+
+    python -m bench.html2text_bench [--docs 300] [--repeat 3]
+"""
+
+import argparse
+import importlib.util
+import random
+import statistics
+import time
+
+from bench.synthetic import page_source
+from common import html2text
+from hugo import markdown_to_html
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    docs = [markdown_to_html(page_source(rnd, i)) for i in range(args.docs)]
+    size = sum(len(d) for d in docs) / len(docs)
+    print(f'{args.docs} documents, {size / 1024:.1f} KB HTML on average')
+
+    engines = ["bs4", "htmlparser"]
+    if importlib.util.find_spec("lxml"):
+        engines.append("lxml")
+
+    reference = [html2text(d, engine="bs4") for d in docs]
+    for engine in engines:
+        timings = []
+        for _ in range(args.repeat):
+            for doc in docs:
+                start = time.perf_counter()
+                html2text(doc, engine=engine)
+                timings.append(time.perf_counter() - start)
+        identical = all(html2text(d, engine=engine) == r for d, r in zip(docs, reference))
+        timings.sort()
+        print(f'{engine:<12} mean {statistics.mean(timings) * 1000:7.3f} ms'
+              f'  median {statistics.median(timings) * 1000:7.3f} ms'
+              f'  p95 {timings[int(len(timings) * 0.95)] * 1000:7.3f} ms'
+              f'  identical: {identical}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares hugo.get_last_modified (single git log walk) with the previous
+implementation (one iter_commits call per Markdown file) on a synthetic
+repository.
+
+Usage:
+
+    python -m bench.last_modified_bench [--files 3000] [--commits 2000]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import git
+
+from bench.synthetic import make_repo
+from hugo import get_last_modified
+
+
+def get_last_modified_per_file(path):
+    """
+    The previous implementation, for comparison.
+    """
+    out = {}
+    repo = git.Repo(path)
+    for blob in repo.tree().traverse():
+        if not blob.path.endswith(".md"):
+            continue
+        commit = list(repo.iter_commits(paths=blob.path, max_count=1))[0]
+        out[blob.path] = datetime.fromtimestamp(commit.committed_date)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--commits", type=int, default=2000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        make_repo(path, args.files, args.commits)
+        print(f'{args.files} files, {args.commits} commits')
+
+        start = time.perf_counter()
+        new = get_last_modified(path)
+        elapsed = time.perf_counter() - start
+        print(f'{"single git log walk":<28} {elapsed:8.2f} s')
+
+        start = time.perf_counter()
+        old = get_last_modified_per_file(path)
+        elapsed = time.perf_counter() - start
+        print(f'{"iter_commits per file":<28} {elapsed:8.2f} s')
+
+        assert new == old, "results differ"
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
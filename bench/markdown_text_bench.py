@@ -0,0 +1,53 @@
+"""
+Microbenchmark of Markdown to text conversion: rendering to HTML and
+parsing it again, versus the direct renderer used by markdown_to_text.
+Reports per document timings.
+
+Usage:
+
+    python -m bench.markdown_text_bench [--docs 300] [--repeat 3]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from bench.synthetic import page_source
+from common import html2text
+from hugo import markdown_to_html, markdown_to_text
+
+
+def round_trip(markdown_text):
+    return html2text(markdown_to_html(markdown_text))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    docs = [page_source(rnd, i) for i in range(args.docs)]
+    size = sum(len(d) for d in docs) / len(docs)
+    print(f'{args.docs} documents, {size / 1024:.1f} KB Markdown on average')
+
+    reference = [round_trip(d) for d in docs]
+    for name, func in (("html round trip", round_trip), ("direct", markdown_to_text)):
+        timings = []
+        for _ in range(args.repeat):
+            for doc in docs:
+                start = time.perf_counter()
+                func(doc)
+                timings.append(time.perf_counter() - start)
+        identical = all(func(d) == r for d, r in zip(docs, reference))
+        timings.sort()
+        print(f'{name:<16} mean {statistics.mean(timings) * 1000:7.3f} ms'
+              f'  median {statistics.median(timings) * 1000:7.3f} ms'
+              f'  p95 {timings[int(len(timings) * 0.95)] * 1000:7.3f} ms'
+              f'  identical: {identical}')
+
+
+if __name__ == "__main__":
+    main()
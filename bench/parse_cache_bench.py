@@ -0,0 +1,47 @@
+"""
+Compares parsing HUGO pages without cache, with a cold parse cache and
+with a warm parse cache.
+
+Usage:
+
+    python -m bench.parse_cache_bench [--pages 1000]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import hugo
+from bench.synthetic import write_pages
+from cache import ParseCache
+
+SITE = hugo.SiteConfig(index_name="bench", repository_handle="example/site", base_url="https://docs.example.com")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        write_pages(root, args.pages)
+        pages = list(hugo.get_pages(root))
+        cache = ParseCache(f'{root}/cache/hugo.sqlite', hugo.PARSE_VERSION, 256 * 1024 * 1024)
+
+        print(f'{args.pages} pages')
+        for name, run_cache in (("no cache", None), ("cold cache", cache), ("warm cache", cache)):
+            start = time.perf_counter()
+            for _ in hugo.parse_pages(pages, {}, SITE, workers=1, cache=run_cache):
+                pass
+            elapsed = time.perf_counter() - start
+            print(f'{name:<12} {elapsed:8.2f} s {elapsed / args.pages * 1000:8.2f} ms/page')
+        print(f'cache: {cache.summary()}')
+        cache.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compares indexing long HUGO pages as one document per page with the
+passage mode (SiteConfig.passages), which splits pages at headings.
+
+Without an OpenSearch endpoint, reports the documents each mode produces:
+their number, the parse time, and the size of the highlighted body field
+per document (highlighting with term vectors reads the whole field of
+each hit, so its cost grows with the field length).
+
+With --endpoint, both variants are also written to indexes with the real
+mapping (mappings/hugo.json) on that cluster, and the index size on disk
+and the latency of highlight queries (as reported by OpenSearch in "took")
+are compared. The indexes are deleted afterwards.
+
+Usage:
+
+    python -m bench.passages_bench [--pages 200] [--sections 40] [--queries 200]
+                                   [--endpoint http://localhost:9200]
+"""
+
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from opensearchpy import OpenSearch
+
+import hugo
+from bench.synthetic import WORDS, page_source
+from common import bulk_index, load_mapping
+
+SITE = hugo.SiteConfig(index_name="bench", repository_handle="example/site", base_url="https://docs.example.com")
+
+
+def write_long_pages(root, count, sections):
+    rnd = random.Random(1)
+    for i in range(count):
+        with open(f'{root}/page-{i}.md', "w") as f:
+            f.write(page_source(rnd, i, sections=sections))
+
+
+def documents(pages, site):
+    start = time.perf_counter()
+    result = [document for _, document in hugo.parse_pages(pages, {}, site, workers=1)]
+    return result, time.perf_counter() - start
+
+
+def describe(name, docs, seconds, pages):
+    sizes = sorted(len(doc["body"].split()) for doc in docs)
+    print(f'{name:<9} {len(docs):6d} documents  parse {seconds / pages * 1000:6.2f} ms/page'
+          f'  body words per document: mean {statistics.mean(sizes):7.0f}'
+          f'  p95 {sizes[int(len(sizes) * 0.95)]:6d}  max {sizes[-1]:6d}')
+
+
+def measure_cluster(es, name, docs, queries):
+    """
+    Writes docs to a new index and returns (store bytes, median and p95
+    highlight query time in ms)
+    """
+    index = f'bench-passages-{name}'
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body={"mappings": load_mapping("hugo")})
+    try:
+        actions = ({"_index": index, "_id": doc["uri"], "_source": doc} for doc in docs)
+        bulk_index(es, actions, label="page")
+        es.indices.refresh(index=index)
+        es.indices.forcemerge(index=index, max_num_segments=1)
+        store = es.indices.stats(index=index, metric="store")["indices"][index]["primaries"]["store"]["size_in_bytes"]
+
+        rnd = random.Random(2)
+        took = []
+        for _ in range(queries):
+            query = f'{rnd.choice(WORDS)} {rnd.choice(WORDS)}'
+            response = es.search(index=index, body={
+                "size": 10,
+                "query": {"match": {"body": query}},
+                "highlight": {"fields": {"body": {"type": "fvh"}}},
+            })
+            took.append(response["took"])
+        took.sort()
+        return store, statistics.median(took), took[int(len(took) * 0.95)]
+    finally:
+        es.indices.delete(index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--endpoint", help="OpenSearch URL to measure index size and query latency on")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        write_long_pages(root, args.pages, args.sections)
+        pages = list(hugo.get_pages(root))
+        print(f'{args.pages} pages with {args.sections} sections each')
+
+        variants = {}
+        for name, site in (("pages", SITE), ("passages", SITE._replace(passages=True))):
+            docs, seconds = documents(pages, site)
+            describe(name, docs, seconds, args.pages)
+            variants[name] = docs
+
+        if args.endpoint:
+            es = OpenSearch(hosts=[args.endpoint])
+            for name, docs in variants.items():
+                store, median, p95 = measure_cluster(es, name, docs, args.queries)
+                print(f'{name:<9} index {store / 1024 / 1024:8.1f} MB  highlight query median {median:6.1f} ms'
+                      f'  p95 {p95:6.1f} ms')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares end-to-end indexing of synthetic HUGO pages into a fake OpenSearch
+server with the sync path (page_actions + bulk_index) and the asyncio
+pipeline (PIPELINE_MODE=async), each with one and several parse workers.
+
+Usage:
+
+    python -m bench.pipeline_bench [--pages 1000] [--latency 0.2] [--chunk-size 100] [--workers 4]
+
+The fake server runs in the same process and competes for the CPU, so use
+a latency that resembles the round trip to a real cluster under load.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from opensearchpy import OpenSearch
+
+import asyncpipeline
+import hugo
+from bench.fake_opensearch import FakeOpenSearch
+from bench.synthetic import write_pages
+from common import bulk_index
+
+SITE = hugo.SiteConfig(index_name="bench", repository_handle="example/site", base_url="https://docs.example.com")
+
+
+def run_sync(server, index, pages, workers, chunk_size):
+    es = OpenSearch(hosts=[server.url])
+    hugo.PARSE_WORKERS = workers
+    return bulk_index(es, hugo.page_actions(index, pages, {}, SITE), label="page", chunk_size=chunk_size)
+
+
+def run_async(server, index, pages, workers, chunk_size):
+    asyncpipeline.BULK_CHUNK_SIZE = chunk_size
+    return hugo.index_pages_async(server.url, index, pages, {}, SITE, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="simulated round trip time per request, in seconds")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        write_pages(root, args.pages)
+        pages = list(hugo.get_pages(root))
+        print(f'{args.pages} pages, {args.latency * 1000:.0f} ms latency, '
+              f'{args.chunk_size} documents per request, {os.cpu_count()} CPUs')
+
+        with FakeOpenSearch(latency=args.latency) as server:
+            for mode, func in (("sync", run_sync), ("async", run_async)):
+                for workers in (1, args.workers):
+                    index = f'bench-{mode}-{workers}'
+                    start = time.perf_counter()
+                    success, failed = func(server, index, pages, workers, args.chunk_size)
+                    elapsed = time.perf_counter() - start
+                    print(f'{mode:<6} {workers} worker(s) {elapsed:8.2f} s '
+                          f'{success / elapsed:8.0f} pages/s  ({success} indexed, {failed} failed)')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
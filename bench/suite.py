@@ -0,0 +1,178 @@
+"""
+End-to-end benchmark of the hugo indexer on a synthetic site, stage by stage.
+
+Generates a git repository with a HUGO site (front matter, shortcodes,
+tables, code fences) and a commit history, then times each stage against
+the in-process fake OpenSearch server:
+
+- get_pages:     finding the Markdown files
+- last_modified: get_last_modified over the commit history
+- parse:         get_front_matter and markdown_to_text for every page
+- write:         bulk_index of the parsed documents
+- index:         the complete indexing loop (parsing and writing)
+- finish:        finish_index_build and swap_alias
+
+Each stage runs --repeat times; the median is reported. Results can be saved
+as a baseline and later runs compared against it. Timings depend on the
+machine, so compare against a baseline taken on the same machine.
+
+Usage:
+
+    python -m bench.suite [--pages 500] [--commits 300] [--repeat 3]
+                          [--save bench/baseline.json] [--baseline bench/baseline.json]
+                          [--tolerance 0.2] [--min-seconds 0.01]
+
+With --baseline, the exit code is 1 if any stage is slower than the baseline
+by more than the tolerance (and by more than --min-seconds).
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from opensearchpy import OpenSearch
+
+import hugo
+from bench.fake_opensearch import FakeOpenSearch
+from bench.synthetic import make_site
+from common import bulk_index, finish_index_build, swap_alias
+
+SUBFOLDER = "src/content"
+SITE = hugo.SiteConfig(index_name="bench", repository_handle="example/site", repository_subfolder=SUBFOLDER,
+                       base_url="https://docs.example.com", type_label="Documentation")
+
+
+def timed(repeat, func):
+    """
+    Calls func repeat times and returns (median seconds, last result)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def run_stages(repo, server, repeat):
+    """
+    Runs all stages and returns a dict stage name => median seconds
+    """
+    content_path = os.path.join(repo, SUBFOLDER)
+    es = OpenSearch(hosts=[server.url])
+    results = {}
+
+    results["get_pages"], pages = timed(repeat, lambda: list(hugo.get_pages(content_path, repo)))
+    results["last_modified"], last_modified = timed(repeat, lambda: hugo.get_last_modified(repo))
+
+    def parse():
+        documents = []
+        for page in pages:
+            with open(page.file_path) as f:
+                data, text = hugo.get_front_matter(f.read(), page.file_path)
+            documents.append((page, data, text))
+        return documents
+    results["parse"], documents = timed(repeat, parse)
+
+    def write():
+        actions = ({"_index": "bench-write", "_id": page.uri, "_source": {"title": data["title"], "body": text}}
+                   for page, data, text in documents)
+        return bulk_index(es, actions, label="page")
+    results["write"], _ = timed(repeat, write)
+
+    generation = iter(range(repeat))
+
+    def index():
+        name = f'bench-{next(generation)}'
+        hugo.ensure_index(es, name, SITE)
+        success, failed = bulk_index(es, hugo.page_actions(name, pages, last_modified, SITE), label="page")
+        assert failed == 0 and success == len(pages), (success, failed)
+        return name
+    results["index"], index_name = timed(repeat, index)
+
+    results["finish"], _ = timed(repeat, lambda: (finish_index_build(es, index_name),
+                                                  swap_alias(es, "bench", index_name, generation=r"[0-9]+")))
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """
+    Prints a comparison with the baseline and returns the names of the
+    stages that got slower by more than tolerance (a fraction) and by
+    more than min_seconds, to ignore noise in very short stages.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f'{name:<14} {seconds:8.3f} s   (not in baseline)')
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > tolerance and seconds - before > min_seconds:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(f'{name:<14} {seconds:8.3f} s   baseline {before:8.3f} s   {change * 100:+6.1f} %{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--commits", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated round trip time per OpenSearch request, in seconds")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    args = parser.parse_args()
+
+    # the fake server answers the first alias lookup with 404
+    logging.getLogger("opensearch").setLevel(logging.ERROR)
+    # measure parsing, not the parse cache or process pool
+    hugo.PARSE_WORKERS = 1
+
+    repo = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        make_site(repo, args.pages, args.commits, subfolder=SUBFOLDER)
+        print(f'{args.pages} pages, {args.commits} commits, generated in {time.perf_counter() - start:.2f} s')
+
+        with FakeOpenSearch(latency=args.latency) as server:
+            results = run_stages(repo, server, args.repeat)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+    settings = {"pages": args.pages, "commits": args.commits, "latency": args.latency}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings:
+            print(f'Warning: baseline was taken with {baseline["settings"]}')
+        regressions = compare(results, baseline["stages"], args.tolerance, args.min_seconds)
+    else:
+        for name, seconds in results.items():
+            print(f'{name:<14} {seconds:8.3f} s')
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"settings": settings, "stages": results}, f, indent=2)
+            f.write("\n")
+
+    if regressions:
+        print(f'Slower than baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Generates synthetic HUGO content for benchmarks: Markdown pages, and git
+repositories with a commit history.
+"""
+
+import os
+import random
+import subprocess
+
+WORDS = ("cluster node pool kubernetes app catalog release upgrade control plane "
+         "workload namespace ingress certificate policy observability alert "
+         "dashboard storage network provider account organization").split()
+
+
+def sentence(rnd, words=12):
+    return " ".join(rnd.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def page_source(rnd, index, sections=6):
+    """
+    Returns the Markdown source of one page with YAML front matter, headings
+    with anchors, shortcodes, a table and a fenced code block.
+    """
+    lines = [
+        "---",
+        f'title: Synthetic page {index}',
+        f'description: {sentence(rnd)}',
+        "weight: 100",
+        'categories: ["synthetic"]',
+        "---",
+        "",
+    ]
+    for s in range(sections):
+        lines += [f'## Section {s} {{#section-{s}}}', ""]
+        lines += [" ".join(sentence(rnd) for _ in range(5)), ""]
+        lines += ['{{< tabs >}}', '{{< tab name="One" >}}', sentence(rnd), '{{< /tab >}}', '{{< /tabs >}}', ""]
+        lines += ["| Name | Description |", "| ---- | ----------- |"]
+        lines += [f'| {rnd.choice(WORDS)} | {sentence(rnd, 6)} |' for _ in range(4)]
+        lines += ["", "```yaml", "apiVersion: v1", "kind: ConfigMap", f'name: config-{s}', "```", ""]
+    return "\n".join(lines)
+
+
+def write_pages(root, count, seed=1):
+    """
+    Writes count Markdown pages into a folder hierarchy below root and
+    returns their paths relative to root.
+    """
+    rnd = random.Random(seed)
+    names = []
+    for i in range(count):
+        name = f'section-{i % 20}/sub-{i % 7}/page-{i}.md'
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(page_source(rnd, i))
+        names.append(name)
+    return names
+
+
+def page_name(index):
+    return f'section-{index % 50}/sub-{index % 7}/page-{index}.md'
+
+
+def make_repo(path, num_files, num_commits, files_per_commit=3, seed=1, subfolder=None, content=None):
+    """
+    Creates a git repository with num_files Markdown files in a folder
+    hierarchy (below subfolder, if given) and num_commits commits, using
+    git fast-import. The first commit adds all files, each later commit
+    modifies files_per_commit random files.
+
+    content(rnd, file index, commit number) returns the content of a file,
+    by default a short placeholder. Returns the file paths relative to the
+    repository root.
+    """
+    rnd = random.Random(seed)
+    prefix = f'{subfolder}/' if subfolder else ""
+    names = [prefix + page_name(i) for i in range(num_files)]
+    subprocess.run(["git", "init", "-q", path], check=True)
+
+    lines = []
+    timestamp = 1500000000
+    for c in range(num_commits):
+        touched = range(num_files) if c == 0 else rnd.sample(range(num_files), files_per_commit)
+        timestamp += 60
+        message = f'commit {c}'
+        lines.append("commit refs/heads/main")
+        lines.append(f'committer Bench <bench@example.com> {timestamp} +0000')
+        lines.append(f'data {len(message)}')
+        lines.append(message)
+        for i in touched:
+            text = content(rnd, i, c) if content else f'# {names[i]}\n\nRevision {c}\n'
+            lines.append(f'M 100644 inline {names[i]}')
+            lines.append(f'data {len(text.encode())}')
+            lines.append(text)
+        lines.append("")
+
+    subprocess.run(["git", "-C", path, "fast-import", "--quiet"],
+                   input="\n".join(lines).encode(), check=True)
+    subprocess.run(["git", "-C", path, "checkout", "-q", "main"], check=True)
+    return names
+
+
+def make_site(path, num_pages, num_commits, subfolder="src/content", seed=1):
+    """
+    Creates a git repository with a HUGO site of num_pages pages like
+    page_source writes them, below subfolder, and num_commits commits.
+    """
+    return make_repo(path, num_pages, num_commits, subfolder=subfolder, seed=seed,
+                     content=lambda rnd, index, commit: page_source(rnd, index))
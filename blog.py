@@ -4,22 +4,34 @@
 #
 # - Initially we index all blog content.
 # - The index we create contains a date stamp in the name.
-# - Subsequent indexing will only look for changes since the last index update.
+# - Subsequent indexing will only look for changes since the last index update
+#   (if INCREMENTAL is true): posts updated since the newest post in the live
+#   index are upserted into that index, unpublished and archived ones deleted.
 
+import asyncio
 from datetime import datetime
+from datetime import timedelta
 from datetime import timezone
-import json
+import hashlib
 import logging
 import os
 import requests
+from requests.adapters import HTTPAdapter
 import sys
+import time
 from time import sleep
+from urllib3.util.retry import Retry
 
 from opensearchpy import OpenSearch
-from opensearchpy.exceptions import NotFoundError
 
+import metrics
+from common import bulk_index
 from common import html2text
-from common import index_settings
+from common import load_mapping
+from common import build_index_settings
+from common import finish_index_build
+from common import swap_alias
+from common import PIPELINE_MODE
 
 HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN")
 OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
@@ -28,44 +40,84 @@ HUBSPOT_ENDPOINT = 'https://api.hubapi.com'
 TIME_FORMAT_FINE = '%Y-%m-%dT%H:%M:%S.%fZ'
 TIME_FORMAT_COARSE = '%Y-%m-%dT%H:%M:%SZ'
 TIME_FORMAT_INDEXNAME = '%Y-%m-%d-%H-%M-%S'
+# Matches the TIME_FORMAT_INDEXNAME part of index names
+GENERATION_INDEXNAME = r'[0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{2}-[0-9]{2}-[0-9]{2}'
 TYPE_LABEL = 'Blog'
 
-with open('mappings/blog.json', 'rb') as f:
-    INDEX_MAPPING = json.load(f)
+# Whether to update the live index with the posts changed since the last
+# run, instead of building a new index.
+INCREMENTAL = os.getenv("INCREMENTAL", "false").lower() == "true"
+
+# Posts updated up to this long before the newest post in the live index
+# are fetched again, to tolerate clock skew and posts saved concurrently
+# with the last run. Upserting them again is harmless.
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+
+# Largest page size the Hubspot API accepts
+PAGE_SIZE = 100
+
+# Retries for rate limited (429) and failed (5xx) Hubspot API requests,
+# with exponential backoff. Retry-After headers are respected.
+RETRY = Retry(
+    total=8,
+    backoff_factor=1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET",))
 
 # Name prefix and alias for our index. Must not contain dashes!
 INDEX_NAME_PREFIX = 'blog'
 
-def get_blog_posts():
+def get_session():
     """
-    Yields all published blog posts from the hubspot API
+    Returns a requests session for the Hubspot API, with connection pooling,
+    authentication and retries.
+    """
+    session = requests.Session()
+    session.headers.update({'accept': 'application/json', 'authorization': 'Bearer ' + HUBSPOT_ACCESS_TOKEN})
+    session.mount('https://', HTTPAdapter(max_retries=RETRY))
+    return session
+
+
+def fetch_blog_posts(session, updated_after=None, archived=False, properties=None):
+    """
+    Yields blog posts in any state from the hubspot API, page by page.
+    Only posts updated after the datetime updated_after, if given.
+    Archived (deleted) posts instead of current ones if archived is True.
+    Only the given list of properties per post, if given.
     """
     url = f'{HUBSPOT_ENDPOINT}/cms/v3/blogs/posts'
-    headers = {'accept': 'application/json', 'authorization': 'Bearer ' + HUBSPOT_ACCESS_TOKEN}
-    r = requests.get(url, headers=headers)
+    params = {'limit': PAGE_SIZE}
+    if properties is not None:
+        params['property'] = ','.join(properties)
+    if updated_after is not None:
+        params['updatedAfter'] = updated_after.strftime(TIME_FORMAT_FINE)
+    if archived:
+        params['archived'] = 'true'
 
-    r.raise_for_status()
-    body = r.json()
+    while url is not None:
+        r = session.get(url, params=params)
+        r.raise_for_status()
+        body = r.json()
 
-    has_more = True
-    while has_more:
-        # Iterate result
-        for post in body['results']:
-            # Skip unpublished content
-            if post['state'] != 'PUBLISHED':
-                continue
+        yield from body['results']
 
-            yield post
+        # Paginate. The next link contains all query parameters.
+        url = body.get('paging', {}).get('next', {}).get('link')
+        params = None
 
-        # Paginate
-        has_more = False
-        if 'paging' in body:
-            if 'next' in body['paging']:
-                if 'link' in body['paging']['next']:
-                    r = requests.get(body['paging']['next']['link'], headers=headers)
-                    r.raise_for_status()
-                    body = r.json()
-                    has_more = True
+
+def get_blog_posts(session=None):
+    """
+    Yields all published blog posts from the hubspot API
+    """
+    if session is None:
+        session = get_session()
+    for post in fetch_blog_posts(session):
+        # Skip unpublished content
+        if post['state'] != 'PUBLISHED':
+            continue
+
+        yield post
 
 
 def parse_blog_post(post):
@@ -84,6 +136,7 @@ def parse_blog_post(post):
         'url': post['url'],
         'uri': post['url'],
         'date': parse_date(post['created']),
+        'updated': parse_date(post['updated']),
         'title': title,
         'image_uri': post['featuredImage'],
         'body': body,
@@ -93,18 +146,159 @@ def parse_blog_post(post):
     return ret
 
 
-def index_blog_post(es, index_name, data):
+def blog_post_actions(index_name, posts):
     """
-    Write content for one blog post to the index
+    Yields one bulk index action per blog post, for use with common.bulk_index
     """
-    id = data['id']
-    try:
-        es.index(
-            index=index_name,
-            id=data['id'],
-            body=data)
-    except Exception as e:
-        logging.error(f'Error when indexing post {id}: {e}')
+    for post in posts:
+        yield blog_post_action(index_name, post)
+
+
+def blog_post_action(index_name, post):
+    """
+    Returns the bulk index action for one blog post
+    """
+    start = time.perf_counter()
+    data = parse_blog_post(post)
+    metrics.observe_parse(time.perf_counter() - start)
+    metrics.inc("parsed_bytes", len(post['postBody'].encode()))
+    return {
+        '_index': index_name,
+        '_id': data['id'],
+        '_source': data,
+    }
+
+
+def get_fingerprint(posts):
+    """
+    Returns a hash over the ids and update times of the published posts,
+    which changes whenever a post is published, updated or unpublished.
+    """
+    published = sorted(f"{post['id']}:{post['updated']}" for post in posts if post['state'] == 'PUBLISHED')
+    return hashlib.sha256('\n'.join(published).encode()).hexdigest()
+
+
+def get_upstream_fingerprint(session):
+    """
+    Returns the fingerprint of the current Hubspot blog posts,
+    fetching only the properties needed for it.
+    """
+    return get_fingerprint(fetch_blog_posts(session, properties=('id', 'updated', 'state')))
+
+
+def get_index_fingerprint(es, index_name):
+    """
+    Returns the fingerprint stored in the index mapping's _meta, or None
+    """
+    mapping = es.indices.get_mapping(index=index_name)[index_name]['mappings']
+    return mapping.get('_meta', {}).get('fingerprint')
+
+
+def set_index_fingerprint(es, index_name, fingerprint):
+    """
+    Stores the fingerprint of the indexed posts in the index mapping's _meta
+    """
+    es.indices.put_mapping(index=index_name, body={'_meta': {'fingerprint': fingerprint}})
+
+
+def index_blog_posts(es, index_name, posts):
+    """
+    Writes the posts to the index. Returns a tuple
+    (number of successful actions, number of failed actions).
+
+    With PIPELINE_MODE 'async', this uses the asyncio pipeline
+    (see asyncpipeline.py), otherwise common.bulk_index.
+    """
+    if PIPELINE_MODE == "async":
+        try:
+            import asyncpipeline
+        except ImportError:
+            logging.warning("opensearch-py async support (aiohttp) is not installed, using PIPELINE_MODE sync")
+        else:
+            async def parse(post):
+                # in a thread, so the writers keep running while a post is parsed
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, blog_post_action, index_name, post)
+
+            return asyncpipeline.index(OPENSEARCH_ENDPOINT, posts, parse, label='post')
+
+    return bulk_index(es, blog_post_actions(index_name, posts), label='post')
+
+
+def changed_blog_post_actions(index_name, posts, archived_posts):
+    """
+    Yields bulk actions that bring an existing index up to date with changed
+    posts: an index action per published post, and a delete action per
+    unpublished or archived post.
+    """
+    for post in posts:
+        if post['state'] == 'PUBLISHED':
+            yield from blog_post_actions(index_name, [post])
+        else:
+            yield {'_op_type': 'delete', '_index': index_name, '_id': post['id']}
+
+    for post in archived_posts:
+        yield {'_op_type': 'delete', '_index': index_name, '_id': post['id']}
+
+
+def get_live_index_name(es):
+    """
+    Returns the name of the index behind the INDEX_NAME_PREFIX alias, or None
+    """
+    if not es.indices.exists_alias(name=INDEX_NAME_PREFIX):
+        return None
+
+    # here we assume there is only one index behind this alias
+    return next(iter(es.indices.get_alias(name=INDEX_NAME_PREFIX).keys()))
+
+
+def get_live_index(es):
+    """
+    Returns a tuple (index name, datetime) for the index behind the
+    INDEX_NAME_PREFIX alias and the newest update time of its posts,
+    or (None, None) if there is no such index or it has no update times.
+    """
+    index_name = get_live_index_name(es)
+    if index_name is None:
+        return (None, None)
+
+    result = es.search(
+        index=index_name,
+        body={"size": 0, "aggs": {"updated": {"max": {"field": "updated"}}}})
+    updated = result['aggregations']['updated']['value']
+    if updated is None:
+        return (index_name, None)
+    return (index_name, datetime.fromtimestamp(updated / 1000, tz=timezone.utc))
+
+
+def run_incremental(es, session, fingerprint):
+    """
+    Updates the live index with the posts changed since its newest post,
+    and stores the new fingerprint in it. Returns False, without changing
+    anything, if a full build is needed.
+    """
+    index_name, updated = get_live_index(es)
+    if index_name is None:
+        logging.info("No live index found, doing a full build.")
+        return False
+    if updated is None:
+        logging.info(f'Index {index_name} has no update times, doing a full build.')
+        return False
+
+    updated_after = updated - INCREMENTAL_OVERLAP
+    logging.info(f'Updating index {index_name} with posts updated after {updated_after}')
+    actions = changed_blog_post_actions(
+        index_name,
+        fetch_blog_posts(session, updated_after=updated_after),
+        fetch_blog_posts(session, updated_after=updated_after, archived=True))
+    with metrics.stage("index"):
+        count, failed = bulk_index(es, actions, label='post')
+    metrics.inc("documents_indexed", count)
+    metrics.inc("documents_failed", failed)
+    logging.info(f'Updated {count} posts, {failed} failed')
+    if failed == 0:
+        set_index_fingerprint(es, index_name, fingerprint)
+    return True
 
 
 def parse_date(datestring):
@@ -130,39 +324,16 @@ def create_index(es, index_name):
     es.indices.create(
         index=index_name,
         body={
-            "settings" : index_settings,
-            "mappings": INDEX_MAPPING
+            "settings" : build_index_settings(),
+            "mappings": load_mapping("blog")
         })
 
 
-def set_index_alias(es, new_index_name):
-    """
-    Ensures that index alias INDEX_NAME_PREFIX points to new_index_name only,
-    deletes the old index/indices the alias pointed to.
-    """
-    if es.indices.exists_alias(name=INDEX_NAME_PREFIX):
-        alias = es.indices.get_alias(name=INDEX_NAME_PREFIX)
-        for index_name in list(alias.keys()):
-            logging.info(f'Removing alias {INDEX_NAME_PREFIX} => {index_name}')
-            try:
-                es.indices.delete_alias(index=index_name, name=INDEX_NAME_PREFIX)
-            except NotFoundError:
-                logging.error(f'Could not delete index alias {INDEX_NAME_PREFIX} => {index_name} (not found)')
-                pass
-
-            try:
-                logging.info(f'Deleting index {index_name}')
-                es.indices.delete(index=index_name)
-            except:
-                logging.error("Could not delete index %s" % index_name)
-                pass
-    es.indices.put_alias(index=new_index_name, name=INDEX_NAME_PREFIX)
-
-
 def run():
     """
     Main function to trigger indexing the blog
     """
+    metrics.start("blog")
     if not HUBSPOT_ACCESS_TOKEN:
         logging.error(f'Environment variable HUBSPOT_ACCESS_TOKEN must be set')
         sys.exit(1)
@@ -175,6 +346,21 @@ def run():
     sleep(3)
     logging.info(f'Establish connection to OpenSearch host {OPENSEARCH_ENDPOINT}')
     es = OpenSearch(hosts=[OPENSEARCH_ENDPOINT])
+    session = get_session()
+
+    # Compare the upstream post set with the one the live index was built from
+    with metrics.stage("fingerprint"):
+        fingerprint = get_upstream_fingerprint(session)
+    live_index_name = get_live_index_name(es)
+    if live_index_name is not None and get_index_fingerprint(es, live_index_name) == fingerprint:
+        logging.info(f'Index {live_index_name} is up to date. Nothing to do.')
+        metrics.current().export()
+        return
+
+    if INCREMENTAL and run_incremental(es, session, fingerprint):
+        metrics.current().export()
+        logging.info(f'Done')
+        return
 
     # Our new target index name
     now_date = datetime.utcnow()
@@ -186,17 +372,24 @@ def run():
 
     logging.info(f'Starting to index hubspot blog')
 
-    count = 0
-    for post in get_blog_posts():
-        doc = parse_blog_post(post)
-        index_blog_post(es, index_name, doc)
-        count += 1
+    with metrics.stage("index"):
+        count, failed = index_blog_posts(es, index_name, get_blog_posts(session))
+    metrics.inc("documents_indexed", count)
+    metrics.inc("documents_failed", failed)
+    logging.info(f'Indexed {count} posts, {failed} failed')
 
     # Set/update index alias
     if count > 0:
-        logging.info(f'Updating index alias {INDEX_NAME_PREFIX} to use {index_name}')
-        set_index_alias(es, index_name)
+        # With failed posts, the next run should try again
+        if failed == 0:
+            set_index_fingerprint(es, index_name, fingerprint)
+        with metrics.stage("finish"):
+            finish_index_build(es, index_name)
+        with metrics.stage("alias"):
+            swap_alias(es, INDEX_NAME_PREFIX, index_name, generation=GENERATION_INDEXNAME)
     else:
-        logging.info(f'No new/updated blog posts found.')
+        logging.info(f'No blog posts indexed, deleting index {index_name}')
+        es.indices.delete(index=index_name)
 
+    metrics.current().export()
     logging.info(f'Done')
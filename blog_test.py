@@ -0,0 +1,146 @@
+import asyncio
+import importlib.util
+import threading
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import blog
+from blog import (
+    changed_blog_post_actions,
+    fetch_blog_posts,
+    get_fingerprint,
+    get_index_fingerprint,
+    get_live_index,
+)
+
+
+def make_post(post_id, state="PUBLISHED"):
+    return {
+        "id": post_id,
+        "state": state,
+        "postBody": "<p>Body</p>",
+        "htmlTitle": "Title",
+        "url": f'https://www.example.com/blog/{post_id}',
+        "created": "2023-01-01T10:00:00.000Z",
+        "updated": "2023-02-01T10:00:00Z",
+        "featuredImage": "",
+    }
+
+
+class FakeSession:
+    """Returns the given response bodies in order and records requests."""
+
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        self.requests = []
+
+    def get(self, url, params=None):
+        self.requests.append((url, params))
+        response = mock.Mock()
+        response.json.return_value = self.bodies.pop(0)
+        return response
+
+
+class TestFetchBlogPosts(unittest.TestCase):
+
+    def test_pagination_and_parameters(self):
+        session = FakeSession([
+            {"results": [make_post("1")], "paging": {"next": {"link": "https://api.hubapi.com/next"}}},
+            {"results": [make_post("2", state="DRAFT")]},
+        ])
+        updated_after = datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+        posts = list(fetch_blog_posts(session, updated_after=updated_after))
+
+        self.assertEqual([p["id"] for p in posts], ["1", "2"])
+        self.assertEqual(session.requests, [
+            ("https://api.hubapi.com/cms/v3/blogs/posts",
+             {"limit": 100, "updatedAfter": "2023-01-02T03:04:05.000000Z"}),
+            ("https://api.hubapi.com/next", None),
+        ])
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_changed_blog_post_actions(self):
+        posts = [make_post("1"), make_post("2", state="DRAFT")]
+        archived = [make_post("3")]
+
+        actions = list(changed_blog_post_actions("blog-1", posts, archived))
+
+        self.assertEqual(actions[0]["_id"], "1")
+        self.assertEqual(actions[0]["_source"]["updated"], datetime(2023, 2, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual(actions[1:], [
+            {"_op_type": "delete", "_index": "blog-1", "_id": "2"},
+            {"_op_type": "delete", "_index": "blog-1", "_id": "3"},
+        ])
+
+    def test_get_live_index(self):
+        es = mock.Mock()
+        es.indices.exists_alias.return_value = True
+        es.indices.get_alias.return_value = {"blog-2023-01-01-00-00-00": {}}
+        es.search.return_value = {"aggregations": {"updated": {"value": 1675245600000.0}}}
+
+        index_name, updated = get_live_index(es)
+
+        self.assertEqual(index_name, "blog-2023-01-01-00-00-00")
+        self.assertEqual(updated, datetime(2023, 2, 1, 10, tzinfo=timezone.utc))
+
+    def test_get_live_index_without_update_times(self):
+        es = mock.Mock()
+        es.indices.exists_alias.return_value = True
+        es.indices.get_alias.return_value = {"blog-2023-01-01-00-00-00": {}}
+        es.search.return_value = {"aggregations": {"updated": {"value": None}}}
+
+        self.assertEqual(get_live_index(es), ("blog-2023-01-01-00-00-00", None))
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_changes_with_published_posts_only(self):
+        posts = [make_post("1"), make_post("2")]
+        fingerprint = get_fingerprint(posts)
+
+        self.assertEqual(get_fingerprint(reversed(posts)), fingerprint)
+        self.assertEqual(get_fingerprint(posts + [make_post("3", state="DRAFT")]), fingerprint)
+        self.assertNotEqual(get_fingerprint(posts[:1]), fingerprint)
+        updated = dict(posts[1], updated="2023-03-01T10:00:00Z")
+        self.assertNotEqual(get_fingerprint([posts[0], updated]), fingerprint)
+
+    def test_get_index_fingerprint(self):
+        es = mock.Mock()
+        es.indices.get_mapping.return_value = {"blog-1": {"mappings": {"_meta": {"fingerprint": "abc"}}}}
+        self.assertEqual(get_index_fingerprint(es, "blog-1"), "abc")
+
+        es.indices.get_mapping.return_value = {"blog-1": {"mappings": {"properties": {}}}}
+        self.assertIsNone(get_index_fingerprint(es, "blog-1"))
+
+class TestAsyncPipeline(unittest.TestCase):
+
+    @unittest.skipUnless(importlib.util.find_spec("aiohttp"), "aiohttp is not installed")
+    def test_parses_off_the_event_loop(self):
+        threads = set()
+        parse_blog_post = blog.parse_blog_post
+
+        def recording(post):
+            threads.add(threading.get_ident())
+            return parse_blog_post(post)
+
+        def index(endpoint, items, parse, **kwargs):
+            async def main():
+                return [await parse(item) for item in items], threading.get_ident()
+            return asyncio.run(main())
+
+        with mock.patch("blog.PIPELINE_MODE", "async"), mock.patch("blog.parse_blog_post", recording), \
+                mock.patch("asyncpipeline.index", index):
+            actions, loop_thread = blog.index_blog_posts(None, "blog-test", [make_post(1), make_post(2)])
+
+        self.assertEqual([a["_id"] for a in actions], [1, 2])
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# Persistent cache for parse results
+#
+# Parsing Markdown pages is the most CPU intensive part of indexing, while
+# most files are unchanged between runs. Parse results are stored in an
+# SQLite database file under WORKDIR, keyed by a hash of the file content.
+# SQLite's file locking makes it safe to share the file between concurrent
+# indexer processes.
+
+import hashlib
+import logging
+import os
+import pickle  # nosec B403 - the cache file is only written by the indexer itself
+import sqlite3
+import time
+
+
+class ParseCache:
+    """
+    Maps file contents to parse results.
+
+    path:      location of the SQLite database file
+    version:   version of the parse pipeline. Entries written with another
+               version are never returned.
+    max_bytes: the least recently used entries are evicted once the total
+               size of all cached values exceeds this.
+    """
+
+    def __init__(self, path, version, max_bytes):
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # Losing the latest writes on a crash is fine for a cache
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.total_bytes = self._total_bytes()
+
+    def key(self, content, kind=None):
+        """
+        Returns the cache key for the given file content (bytes). kind
+        separates results of different parsers for the same content.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        if kind is not None:
+            return f'{self.version}:{kind}:{digest}'
+        return f'{self.version}:{digest}'
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None
+        """
+        row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])  # nosec B301 - see import
+
+    def put(self, key, value):
+        """
+        Stores value for key and evicts old entries if needed
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, blob, len(blob), time.time()))
+        self.total_bytes += len(blob)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _total_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        """
+        Deletes least recently used entries until the total size is
+        below 90% of max_bytes, to not evict on every put.
+        """
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # other processes may have added or evicted entries meanwhile
+            total = self._total_bytes()
+            target = self.max_bytes * 0.9
+            rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_used")
+            evict = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                evict.append((key,))
+                total -= size
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", evict)
+        self.total_bytes = total
+        logging.debug(f'Evicted {len(evict)} entries from parse cache')
+
+    def summary(self):
+        return f'{self.hits} hits, {self.misses} misses'
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cache import ParseCache
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "sub", "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_roundtrip_and_counters(self):
+        cache = ParseCache(self.path, "1", 1024 * 1024)
+        key = cache.key(b"content")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, ({"title": "T"}, "text"))
+        self.assertEqual(cache.get(key), ({"title": "T"}, "text"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.summary(), "1 hits, 1 misses")
+        cache.close()
+
+        # persisted across instances
+        cache = ParseCache(self.path, "1", 1024 * 1024)
+        self.assertEqual(cache.get(key), ({"title": "T"}, "text"))
+        cache.close()
+
+    def test_version_in_key(self):
+        cache_v1 = ParseCache(self.path, "1", 1024 * 1024)
+        cache_v2 = ParseCache(self.path, "2", 1024 * 1024)
+        self.assertNotEqual(cache_v1.key(b"content"), cache_v2.key(b"content"))
+        cache_v1.put(cache_v1.key(b"content"), "v1 result")
+        self.assertIsNone(cache_v2.get(cache_v2.key(b"content")))
+        cache_v1.close()
+        cache_v2.close()
+
+    def test_lru_eviction(self):
+        cache = ParseCache(self.path, "1", 3000)
+        value = "x" * 900
+        keys = [cache.key(str(i).encode()) for i in range(3)]
+        for key in keys:
+            cache.put(key, value)
+        # make the first entry the most recently used one
+        self.assertIsNotNone(cache.get(keys[0]))
+
+        cache.put(cache.key(b"new"), value)
+
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(cache.key(b"new")))
+        self.assertLessEqual(cache.total_bytes, 3000)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,46 @@
-from bs4 import BeautifulSoup
+from functools import cache
+from html.entities import html5
+from html.parser import HTMLParser
+import json
+import logging
+import os
+import re
+
+from opensearchpy.exceptions import NotFoundError
+from opensearchpy.helpers import parallel_bulk, streaming_bulk
+
+# Engine used by html2text:
+# - 'htmlparser': streaming text extraction (default)
+# - 'bs4': BeautifulSoup tree (reference implementation, slower)
+# - 'lxml': lxml, if installed
+HTML2TEXT_ENGINE = os.getenv("HTML2TEXT_ENGINE", "htmlparser")
+
+# Bulk writer tuning. Documents are sent to OpenSearch in _bulk requests of at
+# most BULK_CHUNK_SIZE documents or BULK_MAX_CHUNK_BYTES bytes, whichever limit
+# is hit first. With BULK_THREAD_COUNT > 1, several requests are in flight at
+# the same time.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+BULK_THREAD_COUNT = int(os.getenv("BULK_THREAD_COUNT", "1"))
+
+# 'sync' (default) or 'async'. See asyncpipeline.py.
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sync")
+
+# Index build tuning. Nobody searches a new index until the alias is moved
+# to it, so it is created without periodic refreshes and without replicas,
+# which makes bulk writes cheaper. finish_index_build restores the settings
+# before the alias is moved. With INDEX_FORCE_MERGE, the finished index is
+# also merged into a single segment.
+INDEX_BUILD_TUNING = os.getenv("INDEX_BUILD_TUNING", "true").lower() == "true"
+INDEX_FORCE_MERGE = os.getenv("INDEX_FORCE_MERGE", "false").lower() == "true"
+
+# Number of previous index generations to keep after the alias has been
+# moved to a new index, for a quick rollback by moving the alias back.
+INDEX_RETENTION = int(os.getenv("INDEX_RETENTION", "0"))
+
+# Regular expression for the generation part of index names '<alias>-<generation>':
+# the commit SHA for HUGO sites. blog.py passes its own.
+GENERATION_SHA = r"[0-9a-f]{40}"
 
 # Common settings for all opensearch indexes
 index_settings = {
@@ -30,9 +72,353 @@ index_settings = {
     }
 }
 
-def html2text(html):
+@cache
+def load_mapping(name):
+    """
+    Returns the index mapping in mappings/<name>.json, read on first use
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "mappings", f'{name}.json'), "rb") as f:
+        return json.load(f)
+
+def build_index_settings(settings=None):
+    """
+    Returns the settings to create a new index with, based on the given
+    settings (default index_settings)
+    """
+    settings = settings or index_settings
+    if not INDEX_BUILD_TUNING:
+        return settings
+    return {"index": dict(settings["index"], refresh_interval="-1", number_of_replicas=0)}
+
+
+def finish_index_build(es, index_name):
+    """
+    Makes all documents of a new index searchable, and restores the settings
+    changed by build_index_settings. Call before moving the alias to it.
+    """
+    es.indices.refresh(index=index_name)
+    if INDEX_FORCE_MERGE:
+        logging.info(f'Force merging index {index_name}')
+        es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+    if INDEX_BUILD_TUNING:
+        logging.info(f'Restoring refresh interval and replicas of index {index_name}')
+        # null resets a setting to its default
+        es.indices.put_settings(
+            index=index_name,
+            body={"index": {"refresh_interval": None, "number_of_replicas": None}})
+
+
+def swap_alias(es, alias, index_name, retention=None, generation=GENERATION_SHA):
+    """
+    Points alias to index_name only, in a single atomic _aliases request,
+    so searches never find the alias missing or pointing nowhere. Then
+    deletes the previous generations of the index (indices named
+    '<alias>-<generation>', see delete_old_indices), except for the
+    `retention` newest ones.
+    """
+    retention = INDEX_RETENTION if retention is None else retention
+    try:
+        current = list(es.indices.get_alias(name=alias).keys())
+    except NotFoundError:
+        current = []
+
+    actions = [{"remove": {"index": name, "alias": alias}} for name in current if name != index_name]
+    actions.append({"add": {"index": index_name, "alias": alias}})
+    if current:
+        logging.info(f'Moving alias {alias} from {", ".join(sorted(current))} to {index_name}')
+    else:
+        logging.info(f'Creating alias {alias} for {index_name}')
+    es.indices.update_aliases(body={"actions": actions})
+
+    delete_old_indices(es, alias, index_name, retention, generation)
+
+
+def delete_old_indices(es, alias, index_name, retention, generation=GENERATION_SHA):
+    """
+    Deletes the indices named '<alias>-<generation>', generation being a
+    regular expression, that were created before index_name, except for the
+    `retention` most recently created ones. Other indices starting with
+    '<alias>-' are left alone.
+    """
+    pattern = re.compile(re.escape(alias) + "-" + generation)
+    settings = es.indices.get_settings(index=f'{alias}-*', name="index.creation_date")
+    created = {name: int(value["settings"]["index"]["creation_date"]) for name, value in settings.items()}
+    if index_name not in created:
+        logging.warning(f'Creation date of index {index_name} not found, not deleting old indices')
+        return
+
+    old = sorted(
+        (date, name)
+        for name, date in created.items()
+        if name != index_name and pattern.fullmatch(name) and date < created[index_name])
+
+    for _, name in old[:max(len(old) - retention, 0)]:
+        logging.info(f'Deleting index {name}')
+        try:
+            es.indices.delete(index=name)
+        except NotFoundError:
+            logging.error(f'Could not delete index {name} (not found)')
+
+    for _, name in old[max(len(old) - retention, 0):]:
+        logging.info(f'Keeping previous index {name}')
+
+
+def html2text(html, engine=None):
     """
     Return the plain text (UTF-8) representation of the given HTML
     """
-    parser = BeautifulSoup(html, features="html.parser")
-    return ''.join(parser.find_all(string=True))
+    engine = engine or HTML2TEXT_ENGINE
+    if engine == "lxml":
+        return _html2text_lxml(html)
+    if engine == "bs4":
+        from bs4 import BeautifulSoup
+        parser = BeautifulSoup(html, features="html.parser")
+        return ''.join(parser.find_all(string=True))
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ''.join(extractor.strings)
+
+
+# Names of named character references, without the trailing semicolon
+_ENTITIES = {name.rstrip(";"): char for name, char in html5.items()}
+
+_DECIMAL_CHARREF = re.compile(r"^([0-9]+)(.*)")
+_HEX_CHARREF = re.compile(r"^([0-9a-f]+)(.*)")
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text nodes of an HTML document without building a tree.
+
+    The result is the same as BeautifulSoup(html, features="html.parser")
+    .find_all(string=True): whitespace-only strings outside of <pre> and
+    <textarea> become a single space or newline, character references are
+    resolved the same way, and comments, doctype, CDATA and processing
+    instructions count as strings.
+    """
+
+    # Elements that never have content or a closing tag
+    VOID_ELEMENTS = frozenset([
+        "area", "base", "basefont", "bgsound", "br", "col", "command", "embed",
+        "frame", "hr", "image", "img", "input", "isindex", "keygen", "link",
+        "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+    ])
+    PRESERVE_WHITESPACE_ELEMENTS = frozenset(["pre", "textarea"])
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self._data = []
+        # names of open elements and the indexes of open whitespace preserving ones
+        self._open = []
+        self._preserve = []
+        self._closed_void = []
+
+    def _end_data(self):
+        if not self._data:
+            return
+        data = ''.join(self._data)
+        self._data = []
+        if not self._preserve:
+            data = _collapse_whitespace(data)
+        self.strings.append(data)
+
+    def _push(self, tag):
+        if tag in self.PRESERVE_WHITESPACE_ELEMENTS:
+            self._preserve.append(len(self._open))
+        self._open.append(tag)
+
+    def _pop_to(self, tag):
+        if tag not in self._open:
+            return
+        while self._open:
+            name = self._open.pop()
+            if self._preserve and self._preserve[-1] == len(self._open):
+                self._preserve.pop()
+            if name == tag:
+                return
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        if tag in self.VOID_ELEMENTS:
+            self._closed_void.append(tag)
+        else:
+            self._push(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+        self._push(tag)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void:
+            # closing tag of a void element that is closed already
+            self._closed_void.remove(tag)
+        else:
+            self._end_data()
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_entityref(self, name):
+        self._data.append(_ENTITIES.get(name, "&" + name))
+
+    def handle_charref(self, name):
+        regex = _DECIMAL_CHARREF
+        base = 10
+        if name[:1] in ("x", "X"):
+            name = name[1:]
+            regex = _HEX_CHARREF
+            base = 16
+
+        extra = ""
+        try:
+            number = int(name, base)
+        except ValueError:
+            match = regex.search(name)
+            if match is None:
+                self._data.append(name)
+                return
+            number = int(match.group(1), base)
+            extra = match.group(2)
+
+        # imported here, as character references are rare
+        from bs4.dammit import UnicodeDammit
+        char, _ = UnicodeDammit.numeric_character_reference(number)
+        self._data.append(char + extra)
+
+    def _handle_string(self, data):
+        self._end_data()
+        self._data.append(data)
+        self._end_data()
+
+    def handle_comment(self, data):
+        self._handle_string(data)
+
+    def handle_decl(self, decl):
+        self._handle_string(decl[len("DOCTYPE "):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            data = data[len("CDATA["):]
+        self._handle_string(data)
+
+    def handle_pi(self, data):
+        self._handle_string(data)
+
+    def close(self):
+        super().close()
+        self._end_data()
+
+
+def _html2text_lxml(html):
+    """
+    html2text implementation based on lxml, if installed. Gives the same
+    result as the other engines for the HTML generated from Markdown, but
+    not necessarily for malformed HTML.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        logging.warning("lxml is not installed, using the htmlparser engine for html2text")
+        return html2text(html, engine="htmlparser")
+
+    if _is_whitespace(html):
+        # lxml doesn't return a tree for empty documents
+        return _collapse_whitespace(html) if html else ""
+
+    strings = []
+    preserve_depth = 0
+
+    def add(data):
+        if data is None:
+            return
+        strings.append(data if preserve_depth else _collapse_whitespace(data))
+
+    root = etree.fromstring(html, etree.HTMLParser())
+    for event, element in etree.iterwalk(root, events=("start", "end", "comment", "pi")):
+        if event == "start":
+            if element.tag in TextExtractor.PRESERVE_WHITESPACE_ELEMENTS:
+                preserve_depth += 1
+            add(element.text)
+        elif event == "end":
+            if element.tag in TextExtractor.PRESERVE_WHITESPACE_ELEMENTS:
+                preserve_depth -= 1
+            add(element.tail)
+        else:
+            add(element.text)
+            add(element.tail)
+    return ''.join(strings)
+
+
+def _is_whitespace(data):
+    return not data.strip(" \n\t\x0c\r")
+
+
+def _collapse_whitespace(data):
+    """
+    Replaces strings consisting of ASCII whitespace only with
+    a single newline or space, like BeautifulSoup does.
+    """
+    if _is_whitespace(data):
+        return "\n" if "\n" in data else " "
+    return data
+
+
+def bulk_index(es, actions, label="document",
+               chunk_size=None, max_chunk_bytes=None, thread_count=None, expand_action=None):
+    """
+    Write a stream of bulk actions to OpenSearch and return a tuple
+    (number of successful actions, number of failed actions).
+
+    es:              opensearchpy.OpenSearch client instance
+    actions:         iterable of actions, e. g. {"_index": ..., "_id": ..., "_source": {...}}
+    label:           what a document is called in error messages (e. g. "page")
+    expand_action:   turns an action into the tuple (action line, source) of
+                     the _bulk request, for other kinds of actions (see
+                     artifact.read_actions)
+
+    The actions iterable is consumed lazily, so documents can be produced
+    while earlier chunks are being written. Failures are logged per document
+    and don't stop the run.
+    """
+    kwargs = {
+        "chunk_size": chunk_size or BULK_CHUNK_SIZE,
+        "max_chunk_bytes": max_chunk_bytes or BULK_MAX_CHUNK_BYTES,
+        "raise_on_error": False,
+        "raise_on_exception": False,
+    }
+    if expand_action is not None:
+        kwargs["expand_action_callback"] = expand_action
+    thread_count = thread_count or BULK_THREAD_COUNT
+
+    if thread_count > 1:
+        results = parallel_bulk(es, actions, thread_count=thread_count, **kwargs)
+    else:
+        results = streaming_bulk(es, actions, **kwargs)
+
+    success = 0
+    failed = 0
+    for ok, item in results:
+        if bulk_result_ok(ok, item, label):
+            success += 1
+        else:
+            failed += 1
+
+    return (success, failed)
+
+
+def bulk_result_ok(ok, item, label="document"):
+    """
+    Checks one (ok, item) result of the opensearchpy bulk helpers.
+    Returns True if the action succeeded, otherwise logs the error.
+    """
+    op_type, info = next(iter(item.items()))
+    # a document to delete that is already gone is fine
+    if ok or (op_type == "delete" and info.get("status") == 404):
+        return True
+    error = info.get("error", info.get("status"))
+    logging.error(f'Error when indexing {label} {info.get("_id")}: {error}')
+    return False
@@ -1,5 +1,14 @@
+import importlib.util
+import json
 import unittest
-from common import html2text
+from unittest import mock
+
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import NotFoundError
+
+from common import build_index_settings, bulk_index, finish_index_build, html2text, swap_alias
+from hugo import markdown_to_html
+from hugo_test import markdown_samples
 
 html = """
 <html>
@@ -20,6 +29,9 @@ This is my body
 """
 
 
+# Index generations of the alias docs
+A, B, C, D = (f'docs-{char * 40}' for char in "abcd")
+
 
 class TestHTML2Text(unittest.TestCase):
 
@@ -27,5 +39,154 @@ class TestHTML2Text(unittest.TestCase):
         mytext = html2text(html)
         self.assertEqual(text, mytext)
 
+# HTML edge cases for comparing html2text engines
+html_samples = [
+    "",
+    " \n ",
+    "<p>a<br>b</p>text &lt;tag&gt; &amp",
+    "<!DOCTYPE html><html><!-- comment --><body>a &amp; b &copy; &#169; &#x41; &#128; &#0; &notanentity;</body></html>",
+    "<script>if (a < b) {}</script><style>p {}</style><![CDATA[cdata]]><?pi x?>",
+    "<pre>  indented\n\n  code  </pre> \n <textarea> </textarea> \n ",
+    "<b><pre>  x  </b>  y  ",
+    "<img src=x> \n </img>&#x41;<br/>  <br></br>",
+    "<p title=\"x\">&nbsp;</p><!----> <a href=x>link</a > tail",
+]
+
+
+class TestHTML2TextEngines(unittest.TestCase):
+    """
+    All html2text engines must return the same text as the
+    BeautifulSoup reference implementation.
+    """
+
+    def corpus(self):
+        for sample in markdown_samples:
+            yield markdown_to_html(sample)
+        yield html
+        yield from html_samples
+
+    def assert_engine_matches(self, engine, samples):
+        for sample in samples:
+            with self.subTest(html=sample):
+                self.assertEqual(html2text(sample, engine=engine), html2text(sample, engine="bs4"))
+
+    def test_htmlparser(self):
+        self.assert_engine_matches("htmlparser", self.corpus())
+
+    @unittest.skipUnless(importlib.util.find_spec("lxml"), "lxml is not installed")
+    def test_lxml(self):
+        # lxml is only expected to match for HTML generated from Markdown
+        self.assert_engine_matches("lxml", [markdown_to_html(sample) for sample in markdown_samples])
+
+
+class TestBulkIndex(unittest.TestCase):
+
+    def _bulk_response(self, body, **kwargs):
+        """Fake _bulk endpoint: every document with id 'bad' is rejected."""
+        items = []
+        for line in body.splitlines()[::2]:
+            doc_id = json.loads(line)["index"]["_id"]
+            if doc_id == "bad":
+                items.append({"index": {"_id": doc_id, "status": 400, "error": "mapper_parsing_exception"}})
+            else:
+                items.append({"index": {"_id": doc_id, "status": 201}})
+        return {"errors": any(i["index"]["status"] >= 300 for i in items), "items": items}
+
+    def test_batches_and_reports_failures(self):
+        es = OpenSearch(hosts=["http://localhost:9200"])
+        actions = [{"_index": "test", "_id": doc_id, "_source": {"title": doc_id}}
+                   for doc_id in ("a", "bad", "c", "d", "e")]
+
+        with mock.patch.object(es, "bulk", side_effect=self._bulk_response) as bulk:
+            with self.assertLogs(level="ERROR") as logs:
+                result = bulk_index(es, iter(actions), label="page", chunk_size=2, thread_count=1)
+
+        self.assertEqual(result, (4, 1))
+        self.assertEqual(bulk.call_count, 3)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Error when indexing page bad: mapper_parsing_exception", logs.output[0])
+
+
+class TestIndexBuild(unittest.TestCase):
+
+    def test_build_settings(self):
+        with mock.patch("common.INDEX_BUILD_TUNING", True):
+            settings = build_index_settings()["index"]
+        self.assertEqual(settings["refresh_interval"], "-1")
+        self.assertEqual(settings["number_of_replicas"], 0)
+        self.assertIn("analysis", settings)
+
+        with mock.patch("common.INDEX_BUILD_TUNING", False):
+            self.assertNotIn("refresh_interval", build_index_settings()["index"])
+
+    def test_finish_restores_settings(self):
+        es = mock.Mock()
+        with mock.patch("common.INDEX_BUILD_TUNING", True), mock.patch("common.INDEX_FORCE_MERGE", True):
+            finish_index_build(es, "test")
+
+        self.assertEqual([c[0] for c in es.indices.method_calls], ["refresh", "forcemerge", "put_settings"])
+        es.indices.forcemerge.assert_called_once_with(index="test", max_num_segments=1, request_timeout=600)
+        es.indices.put_settings.assert_called_once_with(
+            index="test", body={"index": {"refresh_interval": None, "number_of_replicas": None}})
+
+
+class TestSwapAlias(unittest.TestCase):
+
+    def _es(self, aliased, created):
+        es = mock.Mock()
+        es.indices.get_alias.return_value = {name: {"aliases": {"docs": {}}} for name in aliased}
+        es.indices.get_settings.return_value = {
+            name: {"settings": {"index": {"creation_date": str(date)}}} for name, date in created.items()}
+        return es
+
+    def test_single_atomic_update_for_several_indices(self):
+        es = self._es([A, B], {A: 1, B: 2, C: 3})
+
+        swap_alias(es, "docs", C, retention=0)
+
+        es.indices.update_aliases.assert_called_once_with(body={"actions": [
+            {"remove": {"index": A, "alias": "docs"}},
+            {"remove": {"index": B, "alias": "docs"}},
+            {"add": {"index": C, "alias": "docs"}},
+        ]})
+        es.indices.put_alias.assert_not_called()
+        self.assertEqual(es.indices.delete.call_args_list, [mock.call(index=A), mock.call(index=B)])
+
+    def test_retention_keeps_newest_generations(self):
+        es = self._es([C], {B: 2, A: 1, C: 3, D: 4})
+
+        swap_alias(es, "docs", D, retention=2)
+
+        self.assertEqual(es.indices.delete.call_args_list, [mock.call(index=A)])
+
+    def test_only_older_generations_are_deleted(self):
+        es = self._es([B], {A: 1, B: 2, C: 3, D: 4, "docs-old": 0, "docs-staging-" + A[5:]: 0, "docs-" + "A" * 40: 0})
+
+        with self.assertLogs(level="INFO"):
+            swap_alias(es, "docs", C, retention=0)
+
+        self.assertEqual(es.indices.delete.call_args_list, [mock.call(index=A), mock.call(index=B)])
+
+    def test_generation_pattern(self):
+        names = {"blog-2024-01-02-03-04-05": 1, "blog-2024-01-02": 2, "blog-backup": 3, "blog-2024-02-02-03-04-05": 4}
+        es = self._es([], names)
+
+        swap_alias(es, "blog", "blog-2024-02-02-03-04-05", retention=0,
+                   generation=r"[0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{2}-[0-9]{2}-[0-9]{2}")
+
+        self.assertEqual(es.indices.delete.call_args_list, [mock.call(index="blog-2024-01-02-03-04-05")])
+
+    def test_first_alias(self):
+        es = self._es([], {A: 1})
+        es.indices.get_alias.side_effect = NotFoundError(404, "alias missing", {})
+
+        swap_alias(es, "docs", A)
+
+        es.indices.update_aliases.assert_called_once_with(body={"actions": [
+            {"add": {"index": A, "alias": "docs"}},
+        ]})
+        es.indices.delete.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,227 @@
+# GitHub API requests, and the branch head check of HUGO sites
+#
+# Each run first requests the branch head commit of the site's repository,
+# conditionally with the ETag of the last indexed head. Without a stored
+# ETag (e. g. in a fresh container), OpenSearch is asked whether the index
+# of the head commit is live already. Like sites.py, this module is kept
+# free of the indexer's dependencies, so an unchanged head ends a run
+# before they are imported.
+
+from random import uniform
+import json
+import logging
+import os
+import time
+import urllib3
+
+import metrics
+
+OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT")
+
+# Connection pool for GitHub API requests, shared by all requests, so
+# connections (and their TLS sessions) are reused
+GITHUB_HTTP = urllib3.PoolManager()
+
+# Connection pool for is_index_live
+OPENSEARCH_HTTP = urllib3.PoolManager()
+
+
+def make_github_api_request(url, token=None, max_retries=3, base_delay=1.0, etag=None):
+    """
+    Make a GitHub API request with retry logic and proper error handling.
+
+    Args:
+        url: The API endpoint URL
+        token: GitHub token for authentication (optional)
+        max_retries: Maximum number of retry attempts
+        base_delay: Base delay for exponential backoff in seconds
+        etag: ETag of a previous response. If the resource is unchanged,
+              the response is 304 Not Modified, without data.
+
+    Returns:
+        tuple: (success: bool, response_data: dict or None, status_code: int, etag: str or None)
+    """
+    headers = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+
+    if token is not None:
+        headers["Authorization"] = f'Bearer {token}'
+        logging.info(f'Making authenticated GitHub API request to {url}')
+    else:
+        logging.info(f'Making unauthenticated GitHub API request to {url}')
+
+    for attempt in range(max_retries + 1):
+        try:
+            req = GITHUB_HTTP.request("GET", url, headers=headers)
+            log_rate_limit(req.headers)
+
+            if req.status == 200:
+                data = json.loads(req.data.decode())
+                return True, data, req.status, req.headers.get("ETag")
+            elif req.status == 304:
+                return True, None, req.status, etag
+            elif req.status in (403, 429):
+                # Check if it's a rate limit issue
+                reset_time = req.headers.get('X-RateLimit-Reset')
+                remaining = req.headers.get('X-RateLimit-Remaining', '0')
+
+                if remaining == '0' and reset_time:
+                    reset_timestamp = int(reset_time)
+                    current_time = int(time.time())
+                    wait_time = reset_timestamp - current_time + 1
+
+                    if wait_time > 0 and wait_time < 3600:  # Don't wait more than 1 hour
+                        logging.warning(f'GitHub API rate limit exceeded. Waiting {wait_time} seconds until reset.')
+                        time.sleep(wait_time)
+                        continue
+
+                logging.error(f'GitHub API returned status {req.status}. This might indicate:')
+                logging.error(f'- Invalid or expired GitHub token')
+                logging.error(f'- Insufficient permissions for the repository')
+                logging.error(f'- Rate limit exceeded (remaining: {remaining})')
+
+                if attempt < max_retries:
+                    delay = base_delay * (2 ** attempt) + uniform(0, 1)
+                    logging.info(f'Retrying in {delay:.2f} seconds... (attempt {attempt + 1}/{max_retries})')
+                    time.sleep(delay)
+                    continue
+
+                return False, None, req.status, None
+            elif req.status >= 500:
+                # Server errors - retry with exponential backoff
+                if attempt < max_retries:
+                    delay = base_delay * (2 ** attempt) + uniform(0, 1)
+                    logging.warning(f'GitHub API server error (status {req.status}). Retrying in {delay:.2f} seconds... (attempt {attempt + 1}/{max_retries})')
+                    time.sleep(delay)
+                    continue
+
+                logging.error(f'GitHub API server error (status {req.status}) after {max_retries} retries')
+                return False, None, req.status, None
+            else:
+                # Other client errors (4xx) - don't retry
+                logging.error(f'GitHub API client error (status {req.status})')
+                return False, None, req.status, None
+
+        except Exception as e:
+            if attempt < max_retries:
+                delay = base_delay * (2 ** attempt) + uniform(0, 1)
+                logging.warning(f'GitHub API request failed with exception: {e}. Retrying in {delay:.2f} seconds... (attempt {attempt + 1}/{max_retries})')
+                time.sleep(delay)
+                continue
+            else:
+                logging.error(f'GitHub API request failed after {max_retries} retries: {e}')
+                return False, None, 0, None
+
+    return False, None, 0, None
+
+def log_rate_limit(headers):
+    """
+    Logs the GitHub API rate limit headroom from the headers of a
+    response, and records it in the run metrics.
+    """
+    try:
+        remaining = int(headers["X-RateLimit-Remaining"])
+        limit = int(headers["X-RateLimit-Limit"])
+        reset = int(headers.get("X-RateLimit-Reset", 0))
+    except (KeyError, ValueError):
+        return
+
+    metrics.gauge("github_rate_limit_remaining", remaining)
+    metrics.gauge("github_rate_limit", limit)
+    message = f'GitHub API rate limit: {remaining} of {limit} requests remaining'
+    if reset:
+        message += f', reset in {max(reset - int(time.time()), 0)} seconds'
+    if remaining < limit * 0.1:
+        logging.warning(message)
+    else:
+        logging.info(message)
+
+
+def read_head_etag(url, path):
+    """
+    Returns the ETag of the last indexed branch head, as stored by
+    write_head_etag in path for the same API URL, or None.
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("url") != url:
+        return None
+    return state.get("etag")
+
+
+def write_head_etag(url, etag, sha, path):
+    """
+    Stores the ETag of the branch head response in path after its commit
+    has been indexed. Errors are logged, not raised.
+    """
+    if etag is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, "w") as f:
+            json.dump({"url": url, "etag": etag, "sha": sha}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f'Could not write ETag to {path}: {e}')
+
+
+def is_index_live(index_name, alias, endpoint=None):
+    """
+    Returns True if alias points to index_name in OpenSearch at endpoint
+    (default OPENSEARCH_ENDPOINT), using a HEAD /<index>/_alias/<alias>
+    request. Returns False if there is no endpoint or the request fails.
+    """
+    endpoint = endpoint or OPENSEARCH_ENDPOINT
+    if endpoint is None:
+        return False
+
+    url = urllib3.util.parse_url(endpoint)
+    headers = {}
+    if url.auth is not None:
+        headers = urllib3.make_headers(basic_auth=url.auth)
+    url = url._replace(auth=None, path=f'{(url.path or "").rstrip("/")}/{index_name}/_alias/{alias}')
+    try:
+        response = OPENSEARCH_HTTP.request("HEAD", url.url, headers=headers, timeout=10.0, retries=2)
+    except urllib3.exceptions.HTTPError as e:
+        logging.warning(f'Could not check whether index {index_name} is live: {e}')
+        return False
+    return response.status == 200
+
+
+def check_branch_head(site):
+    """
+    Requests the branch head commit of the site's repository from the GitHub
+    API, with the ETag of the last indexed head. Returns a tuple (SHA, ETag),
+    with SHA None if the head is unchanged since it was indexed (or its
+    index is live already), or None if the request failed.
+    """
+    url = site.branch_head_url
+
+    # Make GitHub API request with retry logic. With the ETag of the last
+    # indexed head, an unchanged head is answered with 304 Not Modified.
+    success, data, status_code, etag = make_github_api_request(
+        url, site.github_token, etag=read_head_etag(url, site.etag_path))
+
+    if status_code == 304:
+        logging.info(f'{site.repository_handle} branch {site.repository_branch} is unchanged since the last run, nothing to do.')
+        return (None, etag)
+
+    if not success:
+        logging.error(f'Failed to get last commit SHA from GitHub API after retries. Status: {status_code}')
+        logging.error(f'Repository: {site.repository_handle}, Branch: {site.repository_branch}')
+        if site.github_token is None:
+            logging.error('Consider setting GITHUB_TOKEN environment variable for authenticated requests')
+        return None
+
+    sha = data["sha"]
+    logging.info(f'Last {site.repository_handle} commit SHA is {sha}')
+    if is_index_live(f'{site.index_name}-{sha}', site.index_name):
+        logging.info(f'Index {site.index_name}-{sha} is live already, nothing to do.')
+        write_head_etag(url, etag, sha, site.etag_path)
+        return (None, etag)
+    return (sha, etag)
@@ -0,0 +1,96 @@
+# Health endpoint for long running indexers (main.py hugo --watch)
+#
+# Serves GET /healthz on HEALTH_PORT, for Kubernetes probes. It answers 200
+# while an indexing run is in progress or the last successful check (e. g.
+# polling the source repository) is recent enough, and 503 otherwise, with
+# a JSON body describing the state.
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import threading
+import time
+
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "8080"))
+
+
+class Health:
+    """
+    Health state of a long running indexer. Healthy while busy or if the
+    last success is at most max_age seconds ago. Starting counts as success.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.last_success = time.monotonic()
+        self.last_error = None
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def success(self):
+        with self.lock:
+            self.last_success = time.monotonic()
+            self.last_error = None
+
+    def error(self, message):
+        with self.lock:
+            self.last_error = message
+
+    @contextmanager
+    def busy(self):
+        """
+        Context manager for an indexing run, which may take longer than max_age
+        """
+        with self.lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def status(self):
+        """
+        Returns a tuple (healthy, details dict)
+        """
+        with self.lock:
+            age = time.monotonic() - self.last_success
+            healthy = self.running > 0 or age <= self.max_age
+            return (healthy, {
+                "status": "ok" if healthy else "failing",
+                "busy": self.running > 0,
+                "seconds_since_success": round(age, 1),
+                "last_error": self.last_error,
+            })
+
+
+def serve(health, port=None):
+    """
+    Serves the health endpoint in a background thread and returns the
+    server. Call its shutdown() method to stop it.
+    """
+    port = HEALTH_PORT if port is None else port
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/healthz":
+                self.send_error(404)
+                return
+            healthy, details = health.status()
+            body = json.dumps(details).encode()
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+    logging.info(f'Serving health endpoint on port {server.server_address[1]}')
+    return server
@@ -0,0 +1,51 @@
+import json
+import unittest
+import urllib.error
+import urllib.request
+
+import health
+
+
+class TestHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.health = health.Health(max_age=60)
+        self.server = health.serve(self.health, port=0)
+        host, port = self.server.server_address[:2]
+        self.url = f'http://127.0.0.1:{port}/healthz'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self):
+        try:
+            with urllib.request.urlopen(self.url) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def test_healthy_after_success(self):
+        self.health.error("GitHub API request failed")
+        self.health.success()
+        status, details = self._get()
+        self.assertEqual(status, 200)
+        self.assertEqual(details["status"], "ok")
+        self.assertIsNone(details["last_error"])
+
+    def test_failing_without_recent_success(self):
+        self.health.last_success -= 61
+        self.health.error("GitHub API request failed")
+        status, details = self._get()
+        self.assertEqual(status, 503)
+        self.assertEqual(details["last_error"], "GitHub API request failed")
+
+        # a long indexing run is not a failure
+        with self.health.busy():
+            status, details = self._get()
+        self.assertEqual(status, 200)
+        self.assertTrue(details["busy"])
+
+
+if __name__ == '__main__':
+    unittest.main()
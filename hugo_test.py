@@ -1,8 +1,45 @@
+import asyncio
+import gc
+import importlib.util
+import json
 import os
+import random
 import shutil
+import subprocess
+import sys
 import tempfile
+import threading
+import tracemalloc
 import unittest
-from hugo import get_front_matter, markdown_to_text, get_pages, collect_properties_text
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from datetime import datetime
+import artifact
+import hugo
+from cache import ParseCache
+from hugo import (
+    clone_repo,
+    collect_properties_text,
+    crd_actions,
+    get_changed_files,
+    get_front_matter,
+    get_last_modified,
+    get_page,
+    get_pages,
+    incremental_actions,
+    index_pages,
+    markdown_to_html,
+    markdown_to_text,
+    parse_pages,
+    read_crd_documents,
+    read_head_etag,
+    watch,
+    write_head_etag,
+)
+from common import html2text
+from opensearchpy import OpenSearch
+
+SITE = hugo.SiteConfig(index_name="docs", repository_handle="org/repo", base_url="https://docs.example.com")
 
 doc_with_yaml_front_matter = """---
 title: Node Pools
@@ -24,6 +61,41 @@ from a single place; the Control Plane.
 """
 
 
+md_fenced_code = "Intro text.\n\n```nohighlight\nkubectl get pods\n```\n\nAfter text."
+
+md_table = (
+    "Intro.\n\n"
+    "| Name | Role |\n"
+    "| ---- | ---- |\n"
+    "| Alice | Admin |\n"
+    "| Bob | User |\n\n"
+    "Outro."
+)
+
+md_heading_anchors = "## Resource types {#types}\n\nSome content.\n\n### Flags {#flags}\n\nMore."
+
+md_shortcodes = (
+    "Install manually.\n\n"
+    "{{< tabs >}}\n"
+    "{{< tab name=\"Krew\" >}}\n"
+    "Pull the image.\n"
+    "{{< /tab >}}\n"
+    "{{< /tabs >}}\n\n"
+    "{{% steps %}}\n"
+    "Do the thing.\n"
+    "{{% /steps %}}\n"
+)
+
+# All Markdown samples, e. g. for equivalence tests
+markdown_samples = [
+    doc_with_yaml_front_matter,
+    doc_without_front_matter,
+    md_fenced_code,
+    md_table,
+    md_heading_anchors,
+    md_shortcodes,
+]
+
 
 class TestFrontMatter(unittest.TestCase):
 
@@ -36,51 +108,68 @@ class TestFrontMatter(unittest.TestCase):
         data, text = get_front_matter(doc_without_front_matter, "nonepath")
         self.assertIs(data, None)
 
+    def test_get_front_matter_toml_and_json(self):
+        toml_doc = '+++\ntitle = "Node Pools"\nweight = 130\n+++\n\nThe TOML text\n'
+        json_doc = '{\n  "title": "Node Pools",\n  "weight": 130\n}\n\nThe JSON text\n'
+        self.assertEqual(get_front_matter(toml_doc, "tomlpath"), ({"title": "Node Pools", "weight": 130}, "The TOML text"))
+        self.assertEqual(get_front_matter(json_doc, "jsonpath"), ({"title": "Node Pools", "weight": 130}, "The JSON text"))
+
+    def test_get_front_matter_all_fields(self):
+        # all front matter fields are indexed, as dynamically mapped fields
+        data, text = get_front_matter(doc_with_yaml_front_matter, "yamlpath")
+        self.assertEqual(set(data), {"title", "description", "date", "weight", "type", "categories"})
+        data, text = get_front_matter("---\nowner: team\nuser_questions: [How?]\n---\n\nText\n", "questionspath")
+        self.assertEqual(data, {"owner": "team", "user_questions": ["How?"]})
+
+    def test_front_matter_not_a_mapping(self):
+        for doc in ("---\n---\n\nSome body text\n", "---\n- a list\n---\n\nSome body text\n"):
+            with self.subTest(doc=doc), self.assertLogs(level="WARNING"):
+                self.assertEqual(get_front_matter(doc, "emptypath"), ({}, "Some body text"))
+
+    def test_horizontal_rules_are_not_front_matter(self):
+        doc = "Intro\n---\n\nMiddle\n---\n\nEnd\n"
+        self.assertEqual(get_front_matter(doc, "rulespath"), (None, None))
+
+        doc = "---\ntitle: Rules\n---\n\nIntro\n\n---\n\nEnd\n---\n"
+        data, text = get_front_matter(doc, "rulespath")
+        self.assertEqual(data, {"title": "Rules"})
+        self.assertIn("Intro", text)
+        self.assertIn("End", text)
+
+    def test_page_starting_with_shortcode(self):
+        doc = '{{< tabs >}}\nText\n{{< /tabs >}}\n'
+        self.assertEqual(get_front_matter(doc, "shortcodepath"), (None, None))
+
+    def test_invalid_front_matter(self):
+        for doc in ("---\ntitle: [unclosed\n---\n", "+++\ntitle = \n+++\n", "{ nope }\n"):
+            with self.subTest(doc=doc):
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(get_front_matter(doc, "invalidpath"), (None, None))
+
 
 class TestMarkdownToText(unittest.TestCase):
 
     def test_fenced_code_language_indicator_stripped(self):
-        md = "Intro text.\n\n```nohighlight\nkubectl get pods\n```\n\nAfter text."
-        text = markdown_to_text(md)
+        text = markdown_to_text(md_fenced_code)
         self.assertNotIn("nohighlight", text)
         self.assertIn("kubectl get pods", text)
 
     def test_table_separators_stripped(self):
-        md = (
-            "Intro.\n\n"
-            "| Name | Role |\n"
-            "| ---- | ---- |\n"
-            "| Alice | Admin |\n"
-            "| Bob | User |\n\n"
-            "Outro."
-        )
-        text = markdown_to_text(md)
+        text = markdown_to_text(md_table)
         self.assertNotIn("|", text)
         self.assertNotIn("---", text)
         for cell in ("Name", "Role", "Alice", "Admin", "Bob", "User"):
             self.assertIn(cell, text)
 
     def test_heading_anchor_stripped(self):
-        md = "## Resource types {#types}\n\nSome content.\n\n### Flags {#flags}\n\nMore."
-        text = markdown_to_text(md)
+        text = markdown_to_text(md_heading_anchors)
         self.assertNotIn("{#types}", text)
         self.assertNotIn("{#flags}", text)
         self.assertIn("Resource types", text)
         self.assertIn("Flags", text)
 
     def test_shortcodes_stripped(self):
-        md = (
-            "Install manually.\n\n"
-            "{{< tabs >}}\n"
-            "{{< tab name=\"Krew\" >}}\n"
-            "Pull the image.\n"
-            "{{< /tab >}}\n"
-            "{{< /tabs >}}\n\n"
-            "{{% steps %}}\n"
-            "Do the thing.\n"
-            "{{% /steps %}}\n"
-        )
-        text = markdown_to_text(md)
+        text = markdown_to_text(md_shortcodes)
         self.assertNotIn("{{", text)
         self.assertNotIn("}}", text)
         self.assertNotIn("tabs", text)
@@ -88,6 +177,52 @@ class TestMarkdownToText(unittest.TestCase):
         self.assertIn("Pull the image.", text)
         self.assertIn("Do the thing.", text)
 
+    def test_same_text_as_html_round_trip(self):
+        samples = markdown_samples + [
+            "<div>raw *block*</div>\n\n<span>inline</span> &copy; AT&T &#169;\n",
+            "    indented & <code>\n\n`code &amp; <b>`\n",
+            "<script>var a = 1 < 2;</script>\n1. one\n2. two\n<\n",
+            "<pre>\n  pre  \n</pre>\n\n<!-- comment -->\n<?php echo 1; ?>\n",
+            "line  \nbreak <foo@bar.com> <http://example.com> ![img](x.png)\n",
+            "<line  \nbreak[link](http://x.com \"t\")&> quote\n",
+        ]
+        for sample in samples:
+            with self.subTest(sample=sample[:40]):
+                expected = html2text(markdown_to_html(sample), engine="bs4")
+                self.assertEqual(markdown_to_text(sample), expected)
+
+
+md_sections = (
+    "Intro *text*.\n\n"
+    "## Resource types {#types}\n\nSome <b>content</b>.\n\n"
+    "```\n## not a heading\n```\n\n"
+    "#### Detail\n\nDeep.\n\n"
+    "### Flags & options\n\nMore.\n\n"
+    "## Flags & options\n\n<div>raw block</div>\n\n"
+    "## Empty\n"
+)
+
+
+class TestMarkdownToSections(unittest.TestCase):
+
+    def test_sections(self):
+        intro, sections = hugo.markdown_to_sections(md_sections)
+        self.assertEqual(intro, "Intro text.")
+        self.assertEqual([(title, anchor) for title, anchor, _ in sections], [
+            ("Resource types", "types"),
+            ("Flags & options", "flags--options"),
+            ("Flags & options", "flags--options-1"),
+            ("Empty", "empty"),
+        ])
+        self.assertEqual(sections[0][2].split(), ["Some", "content.", "##", "not", "a", "heading", "Detail", "Deep."])
+        self.assertEqual(sections[2][2], "raw block")
+        self.assertEqual(sections[3][2], "")
+
+    def test_without_headings_same_as_text(self):
+        for sample in (md_fenced_code, md_table, md_shortcodes, ""):
+            with self.subTest(sample=sample[:40]):
+                self.assertEqual(hugo.markdown_to_sections(sample), (markdown_to_text(sample), []))
+
 
 class TestGetPages(unittest.TestCase):
 
@@ -111,7 +246,7 @@ class TestGetPages(unittest.TestCase):
         self._write("basics", "nodepools.md")
 
         pages = get_pages(self.root)
-        by_uri = {p["uri"]: p for p in pages}
+        by_uri = {p.uri: p for p in pages}
 
         # top-level index.md maps to the root URI
         self.assertIn("/", by_uri)
@@ -121,9 +256,9 @@ class TestGetPages(unittest.TestCase):
         self.assertIn("/basics/nodepools/", by_uri)
 
         nodepools = by_uri["/basics/nodepools/"]
-        self.assertEqual(nodepools["path"], ["basics", "nodepools"])
+        self.assertEqual(nodepools.path, ("basics", "nodepools"))
         self.assertEqual(
-            nodepools["file_path"],
+            nodepools.file_path,
             os.path.join(self.root, "basics", "nodepools.md"),
         )
 
@@ -131,11 +266,11 @@ class TestGetPages(unittest.TestCase):
         self._write("Advanced", "MyPage.md")
 
         pages = get_pages(self.root)
-        by_uri = {p["uri"]: p for p in pages}
+        by_uri = {p.uri: p for p in pages}
 
         self.assertIn("/advanced/mypage/", by_uri)
         # the URI is lowercased, but the path segments keep their original case
-        self.assertEqual(by_uri["/advanced/mypage/"]["path"], ["Advanced", "MyPage"])
+        self.assertEqual(by_uri["/advanced/mypage/"].path, ("Advanced", "MyPage"))
 
     def test_non_markdown_and_pruned_dirs_ignored(self):
         self._write("notes.txt")
@@ -144,10 +279,507 @@ class TestGetPages(unittest.TestCase):
         self._write("real.md")
 
         pages = get_pages(self.root)
-        uris = {p["uri"] for p in pages}
+        uris = {p.uri for p in pages}
 
         self.assertEqual(uris, {"/real/"})
 
+    def test_relative_path_and_get_page(self):
+        file_path = self._write("src", "content", "Basics", "nodepools.md")
+        content_path = os.path.join(self.root, "src", "content")
+
+        pages = list(get_pages(content_path, self.root))
+
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(pages[0].relative_path, "src/content/Basics/nodepools.md")
+        self.assertEqual(pages[0].path, ("Basics", "nodepools"))
+        # folder names are shared between the pages of a folder
+        self.assertIs(pages[0].path[0], sys.intern("Basics"))
+        self.assertEqual(get_page(content_path, file_path, self.root), pages[0])
+        self.assertEqual(next(get_pages(content_path)).relative_path, "Basics/nodepools.md")
+
+
+class GitRepoTestCase(unittest.TestCase):
+    """Base class for tests that need a scratch git repository."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self._git("init", "-q")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _git(self, *args, timestamp=None, check=True):
+        env = dict(os.environ,
+                   GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+                   GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+        if timestamp is not None:
+            env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = f"@{timestamp} +0000"
+        subprocess.run(["git", "-C", self.root] + list(args), env=env, check=check, stdout=subprocess.DEVNULL)
+
+    def _commit(self, timestamp, files):
+        """Write (or, with content None, delete) files and commit them."""
+        for name, content in files.items():
+            path = os.path.join(self.root, name)
+            if content is None:
+                os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+        self._git("add", "-A")
+        self._git("commit", "-q", "-m", f"commit {timestamp}", timestamp=timestamp)
+
+    def _head(self):
+        return subprocess.check_output(["git", "-C", self.root, "rev-parse", "HEAD"]).decode().strip()
+
+
+class TestGetLastModified(GitRepoTestCase):
+
+    def test_latest_commit_per_markdown_file(self):
+        self._commit(1000, {"a.md": "a", "b c.md": "b", "docs/d.md": "d", "notes.txt": "x"})
+        self._commit(2000, {"a.md": "a2", "docs/d.md": "d2"})
+        self._commit(3000, {"a.md": "a3", "notes.txt": "y"})
+
+        self.assertEqual(get_last_modified(self.root), {
+            "a.md": datetime.fromtimestamp(3000),
+            "b c.md": datetime.fromtimestamp(1000),
+            "docs/d.md": datetime.fromtimestamp(2000),
+        })
+
+    def test_selected_paths_only(self):
+        self._commit(1000, {"a.md": "a", "b.md": "b"})
+        self._commit(2000, {"b.md": "b2"})
+
+        self.assertEqual(get_last_modified(self.root, paths=["b.md"]), {
+            "b.md": datetime.fromtimestamp(2000),
+        })
+
+
+    def _merge(self, timestamp, branch, files=None, strategy=None):
+        """
+        Merge branch into the current one, with files changed in the merge
+        commit itself. Conflicts are committed as they are.
+        """
+        args = ["merge", "-q", "--no-ff", "--no-commit", branch] + (["-s", strategy] if strategy else [])
+        self._git(*args, timestamp=timestamp, check=False)
+        self._commit(timestamp, files or {})
+
+    def assert_same_as_rev_list(self, paths):
+        expected = {}
+        for name in paths:
+            output = subprocess.check_output(
+                ["git", "-C", self.root, "rev-list", "-1", "--format=%ct", "HEAD", "--", name]).decode().split()
+            if output:
+                expected[name] = datetime.fromtimestamp(int(output[-1]))
+        self.assertEqual(get_last_modified(self.root), expected)
+
+    def test_merges(self):
+        self._commit(1000, {"x.md": "x", "y.md": "y", "z.md": "z", "w.md": "w"})
+        self._git("branch", "-M", "main")
+        self._git("checkout", "-q", "-b", "side")
+        self._commit(3000, {"x.md": "x side", "y.md": "y side", "w.md": "w side"})
+        self._git("checkout", "-q", "main")
+        self._commit(2000, {"z.md": "z main", "w.md": "w main"})
+        # the side change of x.md is discarded, y.md is taken from side, and
+        # w.md is changed in the merge compared to both sides (evil merge)
+        self._merge(4000, "side", {"x.md": "x", "w.md": "w merged"})
+
+        self.assertEqual(get_last_modified(self.root), {
+            "x.md": datetime.fromtimestamp(1000),
+            "y.md": datetime.fromtimestamp(3000),
+            "z.md": datetime.fromtimestamp(2000),
+            "w.md": datetime.fromtimestamp(4000),
+        })
+        self.assert_same_as_rev_list(["x.md", "y.md", "z.md", "w.md"])
+
+    def test_same_as_rev_list(self):
+        rnd = random.Random(3)
+        names = [f'{i}.md' for i in range(6)]
+        self._commit(1000, {name: "0" for name in names})
+        self._git("branch", "-M", "main")
+        timestamp = 1000
+        for i in range(12):
+            branch = f'b{i}'
+            self._git("checkout", "-q", "-b", branch, "main")
+            for _ in range(rnd.randint(1, 3)):
+                timestamp += rnd.randint(1, 100)
+                self._commit(timestamp, {name: f'{branch} {timestamp}' for name in rnd.sample(names, 2)})
+            self._git("checkout", "-q", "main")
+            if rnd.random() < 0.5:
+                timestamp += 1
+                self._commit(timestamp, {rnd.choice(names): f'main {timestamp}'})
+            timestamp += 1
+            self._merge(timestamp, branch, strategy=rnd.choice([None, None, "ours"]),
+                        files={rnd.choice(names): f'merge {timestamp}'} if rnd.random() < 0.2 else None)
+        self.assert_same_as_rev_list(names)
+
+    def test_commit_graph_is_written(self):
+        self._commit(1000, {"a.md": "a"})
+        self._commit(2000, {"b.md": "b"})
+        info = os.path.join(self.root, ".git", "objects", "info")
+
+        self.assertEqual(get_last_modified(self.root, paths=["b.md"]), {"b.md": datetime.fromtimestamp(2000)})
+        self.assertTrue(os.path.exists(os.path.join(info, "commit-graphs", "commit-graph-chain")))
+
+    def test_git_failure_is_raised(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            get_last_modified(os.path.join(self.root, "missing"), paths=["a.md"])
+
+
+class TestCloneRepo(GitRepoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._git("config", "uploadpack.allowFilter", "true")
+        self._commit(1000, {"content/a.md": "a", "static/big.bin": "data"})
+        self._git("branch", "-M", "main")
+        self.url = "file://" + self.root
+        self.target = tempfile.mkdtemp()
+        self.clone = os.path.join(self.target, "repo")
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.target, ignore_errors=True)
+
+    def test_reuse_fetches_new_commits(self):
+        self.assertEqual(clone_repo(self.url, "main", self.clone, reuse=True), self._head())
+        marker = os.path.join(self.clone, ".git", "marker")
+        open(marker, "w").close()
+
+        self._commit(2000, {"content/a.md": "a2"})
+        with open(os.path.join(self.clone, "content", "a.md"), "w") as f:
+            f.write("local change")
+
+        self.assertEqual(clone_repo(self.url, "main", self.clone, reuse=True), self._head())
+        # updated in place, not cloned again
+        self.assertTrue(os.path.exists(marker))
+        with open(os.path.join(self.clone, "content", "a.md")) as f:
+            self.assertEqual(f.read(), "a2")
+
+    def test_corrupt_clone_is_replaced(self):
+        os.makedirs(os.path.join(self.clone, ".git"))
+        self.assertEqual(clone_repo(self.url, "main", self.clone, reuse=True), self._head())
+
+    def test_partial_sparse_clone(self):
+        sha = clone_repo(self.url, "main", self.clone, partial=True, sparse_path="content")
+        self.assertEqual(sha, self._head())
+        self.assertTrue(os.path.exists(os.path.join(self.clone, "content", "a.md")))
+        self.assertFalse(os.path.exists(os.path.join(self.clone, "static", "big.bin")))
+        self.assertEqual(get_last_modified(self.clone), {"content/a.md": datetime.fromtimestamp(1000)})
+
+
+class TestIncremental(GitRepoTestCase):
+
+    def test_changed_files(self):
+        self._commit(1000, {"content/a.md": "a", "content/b.md": "b", "content/old.md": "o", "README.txt": "x"})
+        old_sha = self._head()
+        self._commit(2000, {"content/a.md": "a2", "content/new.md": "n", "content/old.md": None, "README.txt": "y"})
+
+        modified, removed = get_changed_files(self.root, old_sha, self._head())
+        self.assertEqual(sorted(modified), ["content/a.md", "content/new.md"])
+        self.assertEqual(removed, ["content/old.md"])
+
+    def test_unknown_commit(self):
+        self._commit(1000, {"a.md": "a"})
+        self.assertIsNone(get_changed_files(self.root, "0" * 40, self._head()))
+
+    def test_incremental_actions(self):
+        self._commit(1000, {"content/docs/a.md": "---\ntitle: A\n---\n\nBody A\n"})
+        content_path = os.path.join(self.root, "content")
+
+        actions = list(incremental_actions("docs-new", self.root, content_path,
+                                           ["content/docs/a.md", "content/img/x.md", "other/b.md"],
+                                           ["content/docs/_index.md"], {}, SITE))
+
+        self.assertEqual([(a.get("_op_type", "index"), a["_id"]) for a in actions],
+                         [("delete", "/docs/"), ("index", "/docs/a/")])
+        self.assertEqual(actions[1]["_source"]["title"], "A")
+        self.assertEqual(actions[1]["_source"]["url"], "https://docs.example.com/docs/a/")
+        self.assertEqual(actions[1]["_index"], "docs-new")
+
+    def test_crd_files_changed(self):
+        self._commit(1000, {"crds/clusters.yaml": CRD.replace("common.yaml", "../schemas/common.yaml"),
+                            "schemas/common.yaml": COMMON, "schemas/unused.yaml": "a: 1\n", "content/a.md": "a"})
+        site = SITE._replace(crd_subfolder="crds")
+        changes = [({"content/a.md": "a2", "schemas/unused.yaml": "a: 2\n"}, False),
+                   ({"schemas/common.yaml": COMMON.replace("Release version", "Release number")}, True),
+                   ({"crds/new.yaml": "a: 1\n"}, True)]
+
+        for timestamp, (files, changed) in enumerate(changes, start=2):
+            old_sha = self._head()
+            self._commit(timestamp * 1000, files)
+            with self.subTest(files=files):
+                self.assertEqual(hugo.crd_files_changed(site, self.root, old_sha, self._head()), changed)
+
+    def test_incremental_needs_same_parser_mapping_and_site(self):
+        self._commit(1000, {"content/a.md": "---\ntitle: A\n---\n\nBody A\n"})
+        old_sha = self._head()
+        self._commit(2000, {"content/a.md": "---\ntitle: A\n---\n\nBody A2\n"})
+        content_path = os.path.join(self.root, "content")
+        meta = hugo.index_mapping(SITE)["_meta"]
+        self.assertEqual(meta["parse_version"], hugo.PARSE_VERSION)
+
+        other_sites = [SITE._replace(base_url="https://staging.example.com"), SITE._replace(type_label="Guide"),
+                       SITE._replace(passages=True), SITE._replace(crd_subfolder="crds"),
+                       SITE._replace(crd_uri_path="/crd/")]
+        cases = [({}, False), (dict(meta, parse_version="1"), False), (dict(meta, mapping_hash="0"), False)]
+        cases += [(hugo.index_mapping(site)["_meta"], False) for site in other_sites]
+        cases += [(meta, True)]
+
+        for built_with, incremental in cases:
+            es = mock.Mock()
+            es.indices.exists_alias.return_value = True
+            es.indices.get_alias.return_value = {f'docs-{old_sha}': {}}
+            es.indices.get_mapping.return_value = {f'docs-{old_sha}': {"mappings": {"_meta": built_with}}}
+            with self.subTest(built_with=built_with), self.assertLogs(level="INFO"), \
+                    mock.patch("hugo.bulk_index", return_value=(1, 0)):
+                result = hugo.run_incremental(es, SITE, self.root, content_path, self._head(), "docs-new")
+                self.assertEqual(result, incremental)
+                self.assertEqual(es.reindex.called, incremental)
+                self.assertEqual(es.indices.create.called, incremental)
+
+
+class TestIndexCommit(unittest.TestCase):
+
+    def test_existing_index_is_made_live(self):
+        sha = "a" * 40
+        for live, swapped in ((f'docs-{sha}', False), (f'docs-{"b" * 40}', True)):
+            es = mock.Mock()
+            es.indices.exists.return_value = True
+            es.indices.exists_alias.return_value = True
+            es.indices.get_alias.return_value = {live: {}}
+            with self.subTest(live=live), mock.patch("hugo.swap_alias") as swap, \
+                    mock.patch("hugo.clone_site") as clone, self.assertLogs(level="INFO"):
+                self.assertIsNone(hugo.index_commit(es, SITE, sha))
+                self.assertEqual(swap.called, swapped)
+                if swapped:
+                    self.assertEqual(swap.call_args.args[1:], ("docs", f'docs-{sha}'))
+                clone.assert_not_called()
+
+
+class TestExport(GitRepoTestCase):
+
+    def test_export(self):
+        self._commit(1000, {"content/docs/a.md": "---\ntitle: A\n---\n\nBody A\n",
+                            "content/docs/b.md": "---\ntitle: B\n---\n\nBody B\n"})
+        site = SITE._replace(repository_subfolder="content", clone_path=self.root)
+        path = os.path.join(self.root, "docs.ndjson.gz")
+
+        with mock.patch("hugo.clone_repo", return_value=self._head()), \
+                mock.patch("hugo.open_parse_cache", return_value=None), \
+                self.assertLogs(level="INFO"):
+            self.assertTrue(hugo.export(path, site))
+
+        header = artifact.read_header(path)
+        self.assertEqual((header["indexer"], header["alias"], header["sha"]), ("hugo", "docs", self._head()))
+        self.assertEqual(header["index"], f'docs-{self._head()}')
+        self.assertEqual(header["mappings"], hugo.index_mapping(site))
+        documents = {meta["index"]["_id"]: json.loads(source) for meta, source in artifact.read_actions(path)}
+        self.assertEqual(sorted(documents), ["/docs/a/", "/docs/b/"])
+        self.assertEqual(documents["/docs/a/"]["title"], "A")
+        self.assertEqual(documents["/docs/a/"]["date"], datetime.fromtimestamp(1000).isoformat())
+
+    def test_clone_failure(self):
+        with mock.patch("hugo.clone_repo", return_value=False), self.assertLogs(level="ERROR"):
+            self.assertIs(hugo.export(os.path.join(self.root, "docs.ndjson"), SITE), False)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "docs.ndjson")))
+
+
+class TestParsePages(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for i in range(12):
+            with open(os.path.join(self.root, f"page{i}.md"), "w") as f:
+                f.write(f"---\ntitle: Page {i}\n---\n\nBody of page {i}\n")
+        with open(os.path.join(self.root, "broken.md"), "w") as f:
+            f.write("---\ntitle: [unclosed\n---\n\nBody\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_process_pool_matches_serial(self):
+        pages = sorted(get_pages(self.root), key=lambda p: p.uri)
+        last_modified = {"page3.md": datetime(2020, 1, 1)}
+
+        results = {}
+        messages = {}
+        for workers in (1, 2):
+            with self.assertLogs(level="WARNING") as logs:
+                results[workers] = list(parse_pages(pages, last_modified, SITE, workers=workers))
+            messages[workers] = [r.getMessage() for r in logs.records]
+
+        self.assertEqual(results[2], results[1])
+        self.assertEqual([page.uri for page, _ in results[2]], [page.uri for page in pages])
+        self.assertEqual(messages[2], messages[1])
+        self.assertTrue(any("broken.md" in m for m in messages[2]))
+
+        by_uri = {page.uri: data for page, data in results[2]}
+        self.assertEqual(by_uri["/page3/"]["date"], datetime(2020, 1, 1))
+        self.assertEqual(by_uri["/page5/"]["body"], "Body of page 5")
+
+    def test_parse_cache(self):
+        pages = sorted(get_pages(self.root), key=lambda p: p.uri)
+        cache = ParseCache(os.path.join(self.root, "cache.sqlite"), "test", 1024 * 1024)
+
+        runs = []
+        for _ in range(2):
+            with self.assertLogs(level="WARNING") as logs:
+                documents = list(parse_pages(pages, {}, SITE, workers=1, cache=cache))
+            runs.append((documents, [r.getMessage() for r in logs.records]))
+        cache.close()
+
+        self.assertEqual((cache.hits, cache.misses), (len(pages), len(pages)))
+        # same documents and log messages from the cache
+        self.assertEqual(runs[1], runs[0])
+
+    def test_parse_cache_logs_each_path(self):
+        shutil.copy(os.path.join(self.root, "broken.md"), os.path.join(self.root, "broken2.md"))
+        pages = [page for page in get_pages(self.root) if "broken" in page.file_path]
+        cache = ParseCache(os.path.join(self.root, "cache.sqlite"), "test", 1024 * 1024)
+        self.addCleanup(cache.close)
+
+        with self.assertLogs(level="WARNING") as logs:
+            list(parse_pages(pages, {}, SITE, workers=1, cache=cache))
+
+        self.assertEqual(cache.hits, 1)
+        for page in pages:
+            self.assertTrue(any(f'Indexing page {page.file_path}:' in r.getMessage() for r in logs.records))
+
+
+    @unittest.skipUnless(importlib.util.find_spec("aiohttp"), "aiohttp is not installed")
+    def test_async_pipeline_parses_off_the_event_loop(self):
+        pages = sorted(get_pages(self.root), key=lambda p: p.uri)
+        threads = set()
+        parse_source_recorded = hugo._parse_source_recorded
+
+        def recording(*args):
+            threads.add(threading.get_ident())
+            return parse_source_recorded(*args)
+
+        def index(endpoint, items, parse, **kwargs):
+            async def main():
+                loop_thread = threading.get_ident()
+                actions = [action for item in items for action in await parse(item)]
+                return actions, loop_thread
+            return asyncio.run(main())
+
+        with mock.patch("hugo._parse_source_recorded", recording), mock.patch("asyncpipeline.index", index), \
+                self.assertLogs(level="WARNING"):
+            actions, loop_thread = hugo.index_pages_async("http://localhost:9200", "test", pages, {}, SITE, workers=1)
+
+        self.assertEqual([a["_id"] for a in actions], [page.uri for page in pages])
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+class TestPassages(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "docs"))
+        with open(os.path.join(self.root, "docs", "guide.md"), "w") as f:
+            f.write("---\ntitle: Guide\ndescription: How to\n---\n\n" + md_sections)
+        self.site = SITE._replace(passages=True, type_label="Documentation")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_page_and_passage_documents(self):
+        pages = list(get_pages(self.root))
+        documents = [document for _, document in parse_pages(pages, {}, self.site)]
+
+        parent, *passages = documents
+        self.assertEqual((parent["uri"], parent["title"], parent["body"]), ("/docs/guide/", "Guide", "Intro text."))
+        self.assertNotIn("parent_uri", parent)
+        self.assertEqual([p["uri"] for p in passages],
+                         ["/docs/guide/#types", "/docs/guide/#flags--options", "/docs/guide/#flags--options-1"])
+        passage = passages[0]
+        self.assertEqual(passage["url"], "https://docs.example.com/docs/guide/#types")
+        self.assertEqual((passage["title"], passage["page_title"]), ("Resource types", "Guide"))
+        self.assertEqual((passage["parent_uri"], passage["anchor"]), ("/docs/guide/", "types"))
+        self.assertEqual((passage["type"], passage["breadcrumb"], passage["breadcrumb_2"]),
+                         ("Documentation", ["docs", "guide"], "guide"))
+        self.assertEqual(passage["date"], parent["date"])
+        self.assertIn("Deep.", passage["body"])
+        self.assertNotIn("Intro", passage["body"])
+
+        actions = list(hugo.page_actions("test", pages, {}, self.site))
+        self.assertEqual([a["_id"] for a in actions], [d["uri"] for d in documents])
+
+    def test_cached_separately(self):
+        pages = list(get_pages(self.root))
+        cache = ParseCache(os.path.join(self.root, "cache.sqlite"), "test", 1024 * 1024)
+        self.addCleanup(cache.close)
+
+        for site in (SITE, self.site, SITE, self.site):
+            documents = list(parse_pages(pages, {}, site, cache=cache))
+            self.assertEqual(len(documents), 4 if site.passages else 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_delete_passages(self):
+        es = mock.Mock()
+        es.delete_by_query.return_value = {"deleted": 3}
+        with self.assertLogs(level="INFO"):
+            hugo.delete_passages(es, "docs-new", self.root, self.root, ["docs/guide.md", "README.txt"])
+        es.indices.refresh.assert_called_once_with(index="docs-new")
+        self.assertEqual(es.delete_by_query.call_args.kwargs["body"],
+                         {"query": {"terms": {"parent_uri": ["/docs/guide/"]}}})
+
+
+class TestStreaming(unittest.TestCase):
+    """Peak memory of indexing must not grow with the number of pages."""
+
+    def setUp(self):
+        self.roots = {}
+        for count in (100, 1000):
+            root = tempfile.mkdtemp()
+            for i in range(count):
+                folder = os.path.join(root, f"section{i % 10}")
+                os.makedirs(folder, exist_ok=True)
+                with open(os.path.join(folder, f"page{i}.md"), "w") as f:
+                    f.write(f"---\ntitle: Page {i}\n---\n\nBody of page {i}\n")
+            self.roots[count] = root
+
+    def tearDown(self):
+        for root in self.roots.values():
+            shutil.rmtree(root, ignore_errors=True)
+
+    @staticmethod
+    def _bulk(body, **kwargs):
+        """Fake _bulk endpoint accepting all documents, without keeping them."""
+        items = [{"index": {"_id": json.loads(line)["index"]["_id"], "status": 201}}
+                 for line in body.splitlines()[::2]]
+        return {"errors": False, "items": items}
+
+    def _peak_memory(self, es, count):
+        root = self.roots[count]
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = index_pages(es, "test", get_pages(root), {}, SITE)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(result, (count, 0))
+        return peak
+
+    @mock.patch("common.BULK_CHUNK_SIZE", 50)
+    @mock.patch("hugo.PIPELINE_MODE", "sync")
+    @mock.patch("hugo.PARSE_WORKERS", 1)
+    def test_peak_memory_bounded_by_chunk_size(self):
+        es = OpenSearch(hosts=["http://localhost:9200"])
+        # a plain function, as a mock would keep the request bodies
+        es.bulk = self._bulk
+
+        # warm up the Markdown renderer and regular expression caches
+        index_pages(es, "test", get_pages(self.roots[100]), {}, SITE)
+        small = self._peak_memory(es, 100)
+        large = self._peak_memory(es, 1000)
+
+        # ten times the pages; holding them all would grow the peak about fivefold
+        self.assertLess(large, 2 * small)
+
 
 class TestCollectPropertiesText(unittest.TestCase):
 
@@ -186,5 +818,254 @@ class TestCollectPropertiesText(unittest.TestCase):
         )
 
 
+    def test_items_and_additional_properties(self):
+        schema = {
+            "properties": {
+                "ports": {"items": {"properties": {"port": {"description": "port number"}}}},
+                "labels": {"additionalProperties": {"description": "label value"}},
+            },
+        }
+        self.assertEqual(collect_properties_text(schema),
+                         ["ports", "port", "port number", "labels", "label value"])
+
+    def test_deep_schema(self):
+        schema = {}
+        inner = schema
+        for _ in range(5000):
+            inner["properties"] = {"child": {}}
+            inner = inner["properties"]["child"]
+        self.assertEqual(len(collect_properties_text(schema)), 5000)
+
+    def test_cyclic_and_shared_schemas(self):
+        shared = {"description": "shared", "properties": {"leaf": {}}}
+        schema = {"properties": {"a": shared, "b": shared}}
+        shared["properties"]["self"] = schema
+        self.assertEqual(collect_properties_text(schema),
+                         ["a", "shared", "leaf", "self", "b"])
+
+
+CRD = """\
+apiVersion: apiextensions.k8s.io/v1
+kind: CustomResourceDefinition
+metadata:
+  name: clusters.example.com
+spec:
+  group: example.com
+  names:
+    kind: Cluster
+    plural: clusters
+  versions:
+  - name: v1
+    served: true
+    schema:
+      openAPIV3Schema:
+        description: A cluster
+        properties:
+          spec:
+            $ref: "common.yaml#/definitions/ClusterSpec"
+  - name: v1alpha1
+    served: false
+    schema:
+      openAPIV3Schema:
+        description: Old cluster
+---
+apiVersion: apiextensions.k8s.io/v1beta1
+kind: CustomResourceDefinition
+metadata:
+  name: nodepools.example.com
+spec:
+  group: example.com
+  names:
+    kind: NodePool
+    plural: nodepools
+  version: v1beta1
+  validation:
+    openAPIV3Schema:
+      description: A node pool
+"""
+
+COMMON = """\
+definitions:
+  ClusterSpec:
+    description: Cluster specification
+    properties:
+      release:
+        description: Release version
+"""
+
+
+class TestCRDs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, "crds"))
+        self.crd_path = os.path.join(self.tmpdir, "crds", "clusters.yaml")
+        with open(self.crd_path, "w") as f:
+            f.write(CRD)
+        with open(os.path.join(self.tmpdir, "crds", "common.yaml"), "w") as f:
+            f.write(COMMON)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_read_crd_documents(self):
+        documents = read_crd_documents(CRD, self.crd_path)
+        self.assertEqual(documents, [
+            {"name": "clusters.example.com", "kind": "Cluster", "version": "v1",
+             "text": "A cluster spec Cluster specification release Release version"},
+            {"name": "nodepools.example.com", "kind": "NodePool", "version": "v1beta1",
+             "text": "A node pool"},
+        ])
+
+    def test_crd_actions_are_cached(self):
+        crd_files = sorted(hugo.get_crd_files(self.tmpdir))
+        last_modified = {"crds/clusters.yaml": "2024-01-02T03:04:05+00:00"}
+        cache = ParseCache(os.path.join(self.tmpdir, "cache.sqlite"), "1", 1024 * 1024)
+        self.addCleanup(cache.close)
+
+        actions = list(crd_actions("test", self.tmpdir, crd_files, last_modified, SITE, cache))
+        self.assertEqual([a["_id"] for a in actions], [
+            "/reference/platform-api/crd/clusters.example.com/#v1",
+            "/reference/platform-api/crd/nodepools.example.com/#v1beta1",
+        ])
+        source = actions[0]["_source"]
+        self.assertEqual(source["title"], "Cluster v1")
+        self.assertEqual(source["breadcrumb"], ["reference", "platform-api", "crd", "clusters.example.com"])
+        self.assertIn("Release version", source["body"])
+        self.assertEqual(source["date"], "2024-01-02T03:04:05+00:00")
+
+        with mock.patch.object(hugo, "read_crd_documents") as read:
+            self.assertEqual(list(crd_actions("test", self.tmpdir, crd_files, last_modified, SITE, cache)), actions)
+        read.assert_not_called()
+
+        with open(os.path.join(self.tmpdir, "crds", "common.yaml"), "w") as f:
+            f.write(COMMON.replace("Release version", "Release number"))
+        actions = list(crd_actions("test", self.tmpdir, crd_files, last_modified, SITE, cache))
+        self.assertIn("Release number", actions[0]["_source"]["body"])
+
+    def test_get_referenced_files(self):
+        other = os.path.join(self.tmpdir, "schemas", "other.json")
+        os.makedirs(os.path.dirname(other))
+        with open(other, "w") as f:
+            f.write('{"$ref": "other.json#/a", "b": {"$ref": "https://example.com/c.yaml"}}')
+        with open(os.path.join(self.tmpdir, "crds", "common.yaml"), "a") as f:
+            f.write('  Other:\n    $ref: "../schemas/other.json#/a"\n  Missing:\n    $ref: missing.yaml\n')
+
+        self.assertEqual(hugo.get_referenced_files(self.crd_path), [
+            os.path.join(self.tmpdir, "crds", "common.yaml"),
+            os.path.join(self.tmpdir, "crds", "missing.yaml"),
+            other,
+        ])
+
+
+class TestGitHubHead(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.site = SITE._replace(github_etag_path=os.path.join(self.tmpdir, "etag", "docs.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_unchanged_head_ends_run_early(self):
+        write_head_etag(self.site.branch_head_url, '"abc"', "a", self.site.etag_path)
+
+        with mock.patch("githubapi.make_github_api_request", return_value=(True, None, 304, '"abc"')) as api, \
+                mock.patch("hugo.OpenSearch") as opensearch:
+            hugo.run(self.site)
+
+        self.assertEqual(api.call_args.kwargs["etag"], '"abc"')
+        opensearch.assert_not_called()
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @mock.patch("hugo.OPENSEARCH_ENDPOINT", "http://localhost:9200")
+    @mock.patch("hugo.PARSE_CACHE_MAX_BYTES", 0)
+    def test_indexes_new_commits_only(self):
+        stop = threading.Event()
+        responses = [
+            (True, {"sha": "a"}, 200, '"etag-a"'),
+            (True, None, 304, '"etag-a"'),
+            (True, {"sha": "b"}, 200, '"etag-b"'),
+            (True, {"sha": "b"}, 200, '"etag-b"'),
+        ]
+
+        def request(url, token=None, etag=None):
+            if len(responses) == 1:
+                stop.set()
+            return responses.pop(0)
+
+        with mock.patch("hugo.make_github_api_request", side_effect=request) as api, \
+                mock.patch("hugo.index_commit", side_effect=[True, False, True]) as index_commit, \
+                mock.patch("hugo.metrics.Metrics.export"):
+            site = SITE._replace(github_etag_path=os.path.join(self.tmpdir, "docs.json"))
+            watch(stop, site, interval=0.01, health_port=0)
+
+        # the ETag is only used once its commit has been indexed
+        self.assertEqual([c.kwargs["etag"] for c in api.call_args_list],
+                         [None, '"etag-a"', '"etag-a"', '"etag-a"'])
+        self.assertEqual([c.args[2] for c in index_commit.call_args_list], ["a", "b", "b"])
+        self.assertTrue(all(c.kwargs["incremental"] for c in index_commit.call_args_list))
+
+
+class TestSites(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    @mock.patch("hugo.OPENSEARCH_ENDPOINT", "http://localhost:9200")
+    @mock.patch("hugo.PARSE_CACHE_MAX_BYTES", 0)
+    @mock.patch("hugo.time.sleep")
+    def test_run_sites(self, sleep):
+        sites = [SITE._replace(index_name=name, repository_handle=f'org/{name}',
+                               github_etag_path=os.path.join(self.tmpdir, f'{name}.json'))
+                 for name in ("docs", "intranet", "handbook")]
+        heads = {
+            "org/docs": (True, {"sha": "a"}, 200, '"etag-a"'),
+            "org/intranet": (True, None, 304, '"etag-b"'),
+            "org/handbook": (True, {"sha": "c"}, 200, '"etag-c"'),
+        }
+        runs = {}
+
+        def request(url, token=None, etag=None):
+            return heads[url.split("/repos/")[1].split("/commits")[0]]
+
+        def index_commit(es, site, sha, cache=None, executor=None):
+            runs[site.index_name] = (es, sha, hugo.metrics.current().site)
+            return site.index_name == "docs" or False
+
+        with mock.patch("githubapi.make_github_api_request", side_effect=request), \
+                mock.patch("hugo.index_commit", side_effect=index_commit), \
+                mock.patch("hugo.metrics.Metrics.export"), \
+                self.assertLogs(level="ERROR") as logs:
+            self.assertFalse(hugo.run_sites(sites, concurrency=3))
+
+        self.assertEqual({name: run[1:] for name, run in runs.items()},
+                         {"docs": ("a", "docs"), "handbook": ("c", "handbook")})
+        # one OpenSearch client for all sites
+        self.assertIs(runs["docs"][0], runs["handbook"][0])
+        self.assertIn("Indexing failed for handbook", logs.output[-1])
+        # only the indexed head is remembered
+        self.assertEqual(read_head_etag(sites[0].branch_head_url, sites[0].etag_path), '"etag-a"')
+        self.assertIsNone(read_head_etag(sites[2].branch_head_url, sites[2].etag_path))
+
+    def test_concurrent_parsing(self):
+        sources = markdown_samples * 5
+        expected = [hugo.markdown_to_text(source) for source in sources]
+        with ThreadPoolExecutor(max_workers=4) as threads:
+            results = list(threads.map(hugo.markdown_to_text, sources))
+        self.assertEqual(results, expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,32 +1,111 @@
 import logging
 import signal
 import sys
+import threading
 
 import click
 
-import hugo as hugomodule
-import blog as blogmodule
+import metrics
+from githubapi import check_branch_head
+from sites import load_sites
+from sites import SiteConfig
+
+# The indexers (hugo, blog, artifact) and their dependencies are imported
+# by the commands using them, to keep the startup of each command short.
+# Runs of main.py hugo without a new commit end after the branch head
+# check, before importing hugo. See main_test.py.
 
 @click.group()
 def cli():
     pass
 
+# In watch mode, SIGTERM sets stop to end the loop after the current run
+watching = False
+stop = threading.Event()
+
+
 @cli.command()
-def hugo():
+@click.option("--watch", is_flag=True,
+              help="Keep running and index each new commit of the branch.")
+@click.option("--export", "export_path", type=click.Path(dir_okay=False),
+              help="Write the index to a bulk artifact (.ndjson, .ndjson.gz or .ndjson.zst) "
+                   "instead of OpenSearch, to be loaded with the load command.")
+def hugo(watch, export_path):
     """
     Index hugo site content
     """
-    hugomodule.run()
+    if watch and export_path:
+        raise click.UsageError("--watch and --export can't be combined.")
+    if export_path:
+        import hugo as hugomodule
+        if not hugomodule.export(export_path):
+            sys.exit(1)
+    elif watch:
+        global watching
+        watching = True
+        import hugo as hugomodule
+        hugomodule.watch(stop)
+    else:
+        site = SiteConfig.from_env()
+        metrics.start("hugo")
+        head = check_branch_head(site)
+        if head is None:
+            sys.exit(1)
+        if head[0] is None:
+            return
+        import hugo as hugomodule
+        hugomodule.run(site, head)
+
+@cli.command()
+@click.argument("config", type=click.Path(exists=True, dir_okay=False))
+@click.option("--concurrency", type=int, default=None,
+              help="Number of sites indexed at the same time. Defaults to MULTI_CONCURRENCY.")
+def multi(config, concurrency):
+    """
+    Index several hugo sites, defined in a YAML/JSON file
+    """
+    try:
+        sites = load_sites(config)
+    except ValueError as e:
+        logging.error(f'Invalid site definitions: {e}')
+        sys.exit(1)
+
+    import hugo as hugomodule
+
+    # tell the sites' log lines apart
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s'))
+
+    if not hugomodule.run_sites(sites, concurrency):
+        sys.exit(1)
+
+@cli.command()
+@click.argument("artifact", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threads", type=int, default=None,
+              help="Number of bulk requests in flight. Defaults to LOAD_THREAD_COUNT.")
+def load(artifact, threads):
+    """
+    Load a bulk artifact written with --export into OpenSearch
+    """
+    import artifact as artifactmodule
+    artifactmodule.run(artifact, threads)
 
 @cli.command()
 def blog():
     """
     Index Hubspot blog content
     """
+    import blog as blogmodule
     blogmodule.run()
 
 
 def sigterm_handler(_signo, _stack_frame):
+    if watching and not stop.is_set():
+        # a second SIGTERM terminates right away
+        logging.info("Stopping due to SIGTERM, after the current run")
+        stop.set()
+        return
     logging.info("Terminating due to SIGTERM")
     sys.exit(0)
 
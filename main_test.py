@@ -0,0 +1,88 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must not be imported before there is something to index:
+# the indexers and their dependencies
+HEAVY_MODULES = {"artifact", "blog", "common", "hugo", "aiohttp", "bs4", "markdown", "opensearchpy", "prance",
+                 "requests", "yaml"}
+
+# main.py hugo, with the branch head unchanged since the last run
+UNCHANGED_HEAD_RUN = """
+import sys
+import githubapi
+githubapi.make_github_api_request = lambda url, token=None, etag=None: (True, None, 304, etag)
+sys.argv = ["main.py", "hugo"]
+import main
+main.cli()
+"""
+
+# main.py hugo without a stored ETag (e. g. in a fresh container), with the
+# index of the branch head live already
+LIVE_INDEX_RUN = """
+import sys
+import types
+import githubapi
+githubapi.make_github_api_request = lambda url, token=None, etag=None: (True, {"sha": "a" * 40}, 200, '"e"')
+githubapi.OPENSEARCH_HTTP.request = lambda method, url, **kwargs: types.SimpleNamespace(status=200)
+sys.argv = ["main.py", "hugo"]
+import main
+main.cli()
+"""
+
+
+def importtime(code, env=None):
+    """
+    Runs code with python -X importtime and returns the tuple (imported top
+    level module names, cumulative import time of code in microseconds)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = set()
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip().split(".")[0])
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return modules, total
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_import(self):
+        modules, total = importtime("import main")
+        self.assertIn("main", modules)
+        self.assertEqual(modules & HEAVY_MODULES, set(), f'import main took {total / 1000:.0f} ms')
+
+    def test_unchanged_head(self):
+        env = dict(os.environ, INDEX_NAME="docs", REPOSITORY_HANDLE="org/docs",
+                   GITHUB_ETAG_PATH=os.path.join(self.tmpdir, "docs.json"))
+        modules, total = importtime(UNCHANGED_HEAD_RUN, env)
+        self.assertIn("githubapi", modules)
+        self.assertEqual(modules & HEAVY_MODULES, set(), f'imports took {total / 1000:.0f} ms')
+
+    def test_live_index_without_etag(self):
+        env = dict(os.environ, INDEX_NAME="docs", REPOSITORY_HANDLE="org/docs",
+                   OPENSEARCH_ENDPOINT="http://localhost:9200",
+                   GITHUB_ETAG_PATH=os.path.join(self.tmpdir, "docs.json"))
+        modules, total = importtime(LIVE_INDEX_RUN, env)
+        self.assertIn("githubapi", modules)
+        self.assertEqual(modules & HEAVY_MODULES, set(), f'imports took {total / 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    unittest.main()
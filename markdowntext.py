@@ -0,0 +1,298 @@
+# Markdown to plain text, without the detour through HTML
+#
+# MarkdownTextRenderer gives the same text as html2text() on the HTML that
+# Python-Markdown renders, at a fraction of the cost. To do so, it imports
+# private names of markdown.serializers (_escape_cdata, _escape_attrib_html)
+# and re-implements parts of the serializer and of the raw HTML
+# post-processor. This couples it to the internals of one Markdown release:
+# the Markdown dependency must stay pinned to an exact version in
+# pyproject.toml, and each upgrade must pass hugo_test.py, which compares
+# the result with html2text(markdown_to_html(...)).
+
+import re
+from xml.etree.ElementTree import Comment, ProcessingInstruction
+
+from markdown import Markdown, util
+from markdown.serializers import HTML_EMPTY, _escape_attrib_html, _escape_cdata
+from markdown.treeprocessors import Treeprocessor
+
+from common import TextExtractor
+
+
+class MarkdownTextRenderer:
+    """
+    Converts Markdown to plain text directly from the parsed element tree,
+    without serializing it to HTML and parsing that again.
+
+    The tree is walked the way Python-Markdown's XHTML serializer and
+    post-processors would write it, and the resulting tags and text are fed
+    straight into common.TextExtractor. Only raw HTML from the Markdown
+    source (and code blocks, which Python-Markdown also stores as raw HTML)
+    goes through the HTML parser. The result is identical to
+    html2text(markdown(markdown_text, extensions=extensions)).
+
+    A renderer is not thread safe.
+    """
+
+    def __init__(self, extensions):
+        self.md = Markdown(extensions=extensions)
+        # Capture the final tree instead of serializing it. The serializer
+        # is also used for inline raw HTML, which still gets serialized.
+        self.md.treeprocessors.register(_CaptureTree(self), "capture_tree", 0)
+        self.serializer = self.md.serializer
+        self.md.serializer = self._serialize
+        self.root = None
+        self.raw_html = self.md.postprocessors["raw_html"]
+
+    def _serialize(self, element):
+        if element is self.root:
+            return f'<{self.md.doc_tag}></{self.md.doc_tag}>'
+        return self.serializer(element)
+
+    def render(self, markdown_text):
+        """
+        Converts Markdown (unicode) to plain text
+        """
+        if not markdown_text.strip():
+            return ""
+
+        self.md.reset()
+        self.md.convert(markdown_text)
+        ops = []
+        self._walk_children(self.root, ops)
+        self.root = None
+        return self._text(ops)
+
+    def render_sections(self, markdown_text, headings):
+        """
+        Converts Markdown to plain text like render, split into sections at
+        the top level headings with the given tags (e. g. ("h1", "h2")).
+        Returns a tuple (text before the first heading, list of sections),
+        each section being a tuple (heading text, anchor, text).
+
+        The anchor is the heading's id from an attr_list ({#anchor}), or the
+        id HUGO generates from the heading text.
+        """
+        if not markdown_text.strip():
+            return ("", [])
+
+        self.md.reset()
+        self.md.convert(markdown_text)
+        root = self.root
+        self.root = None
+
+        intro = ops = []
+        if root.text:
+            ops.append(("data", _escape_cdata(root.text)))
+        sections = []
+        anchors = set()
+        for child in root:
+            if not (isinstance(child.tag, str) and child.tag in headings):
+                self._walk(child, ops)
+                continue
+            heading_ops = []
+            self._walk_children(child, heading_ops)
+            title = self._text(heading_ops)
+            anchor = _unique_anchor(child.get("id") or _heading_anchor(title), anchors)
+            ops = []
+            if child.tail:
+                ops.append(("data", _escape_cdata(child.tail)))
+            sections.append((title, anchor, ops))
+
+        return (self._text(intro), [(title, anchor, self._text(ops)) for title, anchor, ops in sections])
+
+    def _text(self, ops):
+        """
+        Returns the text of the operations of the current document
+        """
+        # Markdown strips whitespace from the serialized document, once
+        # before and once after the post-processors.
+        _strip_ops(ops)
+        ops = self._postprocess(ops)
+        _strip_ops(ops)
+
+        extractor = TextExtractor()
+        for i, (op, value) in enumerate(ops):
+            if extractor.rawdata or extractor.cdata_elem:
+                # Malformed raw HTML (e.g. an unclosed <script> or a lone
+                # "<") left the parser in the middle of a construct, which
+                # may swallow the markup that follows. Feed the rest as HTML.
+                extractor.feed(''.join(_serialize_op(op, value) for op, value in ops[i:]))
+                break
+            if op == "data":
+                if "&" in value:
+                    extractor.feed(value)
+                else:
+                    extractor.handle_data(value)
+            elif op == "raw":
+                extractor.feed(value)
+            elif op == "start":
+                extractor.handle_starttag(value[0].lower(), [])
+            elif op == "end":
+                extractor.handle_endtag(value.lower())
+            elif op == "startend":
+                extractor.handle_startendtag(value[0].lower(), [])
+            elif op == "comment":
+                extractor.handle_comment(value)
+            elif op == "pi":
+                extractor.handle_pi(value)
+        extractor.close()
+        return ''.join(extractor.strings)
+
+    def _walk_children(self, element, ops):
+        if element.text:
+            ops.append(("data", _escape_cdata(element.text)))
+        for child in element:
+            self._walk(child, ops)
+
+    def _walk(self, element, ops):
+        """
+        Appends (operation, value) tuples for element and its tail to ops,
+        in the order the XHTML serializer would write them.
+        """
+        tag = element.tag
+        if tag is Comment:
+            ops.append(("comment", _escape_cdata(element.text)))
+        elif tag is ProcessingInstruction:
+            ops.append(("pi", _escape_cdata(element.text) + "?"))
+        elif tag is None:
+            self._walk_children(element, ops)
+        elif tag.lower() in HTML_EMPTY:
+            # void elements are written as <tag />, without content
+            ops.append(("startend", (tag, _serialize_attributes(element))))
+        elif self._is_placeholder_paragraph(element):
+            # the raw HTML post-processor replaces <p>placeholder</p>
+            # with block level HTML
+            ops.append(("data", element.text))
+        else:
+            ops.append(("start", (tag, _serialize_attributes(element))))
+            self._walk_children(element, ops)
+            ops.append(("end", tag))
+
+        if element.tail:
+            ops.append(("data", _escape_cdata(element.tail)))
+
+    def _is_placeholder_paragraph(self, element):
+        if element.tag != "p" or len(element) or element.items():
+            return False
+        match = _PLACEHOLDER_RE.fullmatch(element.text or "")
+        if match is None:
+            return False
+        key = int(match.group(1))
+        if key >= self.md.htmlStash.html_counter:
+            return False
+        html = str(self.md.htmlStash.rawHtmlBlocks[key])
+        return self.raw_html.isblocklevel(html)
+
+    def _postprocess(self, ops):
+        """
+        Replaces raw HTML placeholders in data with "raw" operations and
+        restores ampersands, like the Markdown post-processors do.
+        """
+        result = []
+        for op, value in ops:
+            if op in ("start", "startend"):
+                tag, attributes = value
+                result.append((op, (tag, attributes.replace(util.AMP_SUBSTITUTE, "&"))))
+                continue
+            if op != "data" or util.STX not in value:
+                result.append((op, value.replace(util.AMP_SUBSTITUTE, "&")))
+                continue
+            pos = 0
+            for match in _PLACEHOLDER_RE.finditer(value):
+                key = int(match.group(1))
+                if key >= self.md.htmlStash.html_counter:
+                    continue
+                if match.start() > pos:
+                    result.append(("data", value[pos:match.start()].replace(util.AMP_SUBSTITUTE, "&")))
+                html = self.raw_html.run(str(self.md.htmlStash.rawHtmlBlocks[key]))
+                result.append(("raw", html.replace(util.AMP_SUBSTITUTE, "&")))
+                pos = match.end()
+            if pos < len(value):
+                result.append(("data", value[pos:].replace(util.AMP_SUBSTITUTE, "&")))
+        return result
+
+
+class _CaptureTree(Treeprocessor):
+    """
+    Stores the final element tree on the MarkdownTextRenderer
+    """
+
+    def __init__(self, renderer):
+        super().__init__(renderer.md)
+        self.renderer = renderer
+
+    def run(self, root):
+        self.renderer.root = root
+
+
+_PLACEHOLDER_RE = re.compile(util.HTML_PLACEHOLDER % r"([0-9]+)")
+
+
+def _serialize_op(op, value):
+    """
+    Returns the HTML the serializer writes for an operation
+    """
+    if op == "start":
+        return f'<{value[0]}{value[1]}>'
+    if op == "end":
+        return f'</{value}>'
+    if op == "startend":
+        return f'<{value[0]}{value[1]} />'
+    if op == "comment":
+        return f'<!--{value}-->'
+    if op == "pi":
+        return f'<?{value}>'
+    return value
+
+
+def _serialize_attributes(element):
+    """
+    Returns the attributes of element the way the serializer writes them
+    """
+    return ''.join(f' {k}="{_escape_attrib_html(v)}"' for k, v in sorted(element.items()))
+
+
+def _strip_ops(ops):
+    """
+    Strips whitespace from the beginning and end of the text
+    represented by a list of operations, like str.strip() would.
+    """
+    while ops and ops[0][0] in ("data", "raw"):
+        op, value = ops[0]
+        value = value.lstrip()
+        if value:
+            ops[0] = (op, value)
+            break
+        ops.pop(0)
+    while ops and ops[-1][0] in ("data", "raw"):
+        op, value = ops[-1]
+        value = value.rstrip()
+        if value:
+            ops[-1] = (op, value)
+            break
+        ops.pop()
+
+
+def _heading_anchor(title):
+    """
+    Returns the id HUGO generates for a heading without an explicit one
+    (autoHeadingIDType "github"): lower case, spaces replaced by dashes,
+    other punctuation removed.
+    """
+    anchor = "".join(c for c in title.strip().lower() if c.isalnum() or c in " -_")
+    return anchor.replace(" ", "-")
+
+
+def _unique_anchor(anchor, seen):
+    """
+    Makes anchor unique among the ones in seen (and adds it), the way HUGO
+    does for repeated headings: section, section-1, section-2, ...
+    """
+    candidate = anchor
+    i = 0
+    while candidate in seen:
+        i += 1
+        candidate = f'{anchor}-{i}'
+    seen.add(candidate)
+    return candidate
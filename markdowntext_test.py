@@ -0,0 +1,51 @@
+import unittest
+
+from markdown import markdown
+
+from common import html2text
+from markdowntext import MarkdownTextRenderer
+
+EXTENSIONS = ["tables", "fenced_code"]
+
+SOURCE = """# Title
+
+Some *text* with <span title="a &amp; b">inline HTML</span>.
+
+<div>
+  Raw <b>block</b>
+</div>
+
+| A | B |
+|---|---|
+| 1 | 2 |
+
+```python
+x = "<tag>"
+```
+
+## Second
+
+More text.
+"""
+
+
+class TestMarkdownTextRenderer(unittest.TestCase):
+
+    def test_same_text_as_html2text(self):
+        # Guards the private markdown.serializers API the renderer relies on
+        renderer = MarkdownTextRenderer(EXTENSIONS)
+        self.assertEqual(
+            renderer.render(SOURCE),
+            html2text(markdown(SOURCE, extensions=EXTENSIONS)),
+        )
+
+    def test_sections(self):
+        renderer = MarkdownTextRenderer(EXTENSIONS)
+        intro, sections = renderer.render_sections(SOURCE, ("h2",))
+        self.assertTrue(intro.startswith("Title"))
+        self.assertEqual(sections, [("Second", "second", "More text.")])
+
+    def test_empty(self):
+        renderer = MarkdownTextRenderer(EXTENSIONS)
+        self.assertEqual(renderer.render("  \n"), "")
+        self.assertEqual(renderer.render_sections("", ("h2",)), ("", []))
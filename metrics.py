@@ -0,0 +1,255 @@
+# Run metrics
+#
+# Times the stages of an indexer run (e. g. clone, parsing, writing) and
+# collects document counts, parsed bytes, per document parse latencies and
+# gauges like the GitHub API rate limit headroom.
+# At the end of a run, the metrics are logged as one summary line and
+# exported in the Prometheus text format:
+#
+# - METRICS_TEXTFILE: file to write, e. g. for the node exporter's textfile
+#   collector. Written atomically.
+# - METRICS_PUSHGATEWAY: URL of a Prometheus Pushgateway (or compatible
+#   endpoint) to push to, e. g. http://pushgateway:9091
+#
+# Metrics are recorded in the main process only. The module keeps one set
+# of metrics per process, started with metrics.start(indexer name). Sites
+# indexed concurrently (main.py multi) start one set per thread, labeled
+# with the site, with metrics.start(indexer name, site=index name).
+
+from contextlib import contextmanager
+import bisect
+import logging
+import os
+import threading
+import time
+
+import urllib3
+
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_PUSHGATEWAY = os.getenv("METRICS_PUSHGATEWAY")
+
+# Help texts of the gauges set with gauge()
+GAUGE_HELP = {
+    "github_rate_limit": "GitHub API requests allowed in the current rate limit window.",
+    "github_rate_limit_remaining": "GitHub API requests remaining in the current rate limit window.",
+}
+
+# Upper bounds of the parse latency histogram buckets, in seconds
+PARSE_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, like a Prometheus histogram
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket containing the q-quantile
+        """
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    The metrics of one indexer run
+    """
+
+    def __init__(self, indexer, site=None):
+        self.indexer = indexer
+        self.site = site
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.parse_seconds = Histogram(PARSE_SECONDS_BUCKETS)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager timing a stage of the run. Repeated stages add up.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe_parse(self, seconds):
+        self.parse_seconds.observe(seconds)
+
+    def documents_per_second(self):
+        seconds = self.stages.get("index")
+        if not seconds:
+            return 0.0
+        return self.counters.get("documents_indexed", 0) / seconds
+
+    def summary(self):
+        """
+        Returns a one line summary of the run
+        """
+        stages = ", ".join(f'{name} {seconds:.2f}s' for name, seconds in self.stages.items())
+        parts = [
+            f'stages: {stages or "none"}',
+            f'{self.counters.get("documents_indexed", 0)} documents indexed, '
+            f'{self.counters.get("documents_failed", 0)} failed, '
+            f'{self.documents_per_second():.1f} docs/s',
+        ]
+        if self.parse_seconds.count:
+            parts.append(
+                f'{self.parse_seconds.count} parsed, '
+                f'{self.counters.get("parsed_bytes", 0) / 1024 / 1024:.1f} MB, '
+                f'p50 <= {self.parse_seconds.quantile(0.5) * 1000:g} ms, '
+                f'p95 <= {self.parse_seconds.quantile(0.95) * 1000:g} ms')
+        return "; ".join(parts)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        label = f'indexer="{self.indexer}"'
+        if self.site is not None:
+            label += f',site="{self.site}"'
+        lines = [
+            "# HELP indexer_last_run_timestamp_seconds Start time of the last run.",
+            "# TYPE indexer_last_run_timestamp_seconds gauge",
+            f'indexer_last_run_timestamp_seconds{{{label}}} {self.started:.3f}',
+            "# HELP indexer_stage_duration_seconds Duration of each stage of the last run.",
+            "# TYPE indexer_stage_duration_seconds gauge",
+        ]
+        for name, seconds in self.stages.items():
+            lines.append(f'indexer_stage_duration_seconds{{{label},stage="{name}"}} {seconds:.6f}')
+
+        lines += [
+            "# HELP indexer_documents Number of documents written in the last run, by result.",
+            "# TYPE indexer_documents gauge",
+            f'indexer_documents{{{label},result="success"}} {self.counters.get("documents_indexed", 0)}',
+            f'indexer_documents{{{label},result="failed"}} {self.counters.get("documents_failed", 0)}',
+            "# HELP indexer_documents_per_second Documents indexed per second in the index stage of the last run.",
+            "# TYPE indexer_documents_per_second gauge",
+            f'indexer_documents_per_second{{{label}}} {self.documents_per_second():.3f}',
+            "# HELP indexer_parsed_bytes Size of the source documents parsed in the last run.",
+            "# TYPE indexer_parsed_bytes gauge",
+            f'indexer_parsed_bytes{{{label}}} {self.counters.get("parsed_bytes", 0)}',
+            "# HELP indexer_parse_cache_hits Documents taken from the parse cache in the last run.",
+            "# TYPE indexer_parse_cache_hits gauge",
+            f'indexer_parse_cache_hits{{{label}}} {self.counters.get("parse_cache_hits", 0)}',
+            "# HELP indexer_parse_duration_seconds Time to parse one document in the last run.",
+            "# TYPE indexer_parse_duration_seconds histogram",
+        ]
+        total = 0
+        histogram = self.parse_seconds
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            total += count
+            lines.append(f'indexer_parse_duration_seconds_bucket{{{label},le="{bound:g}"}} {total}')
+        lines += [
+            f'indexer_parse_duration_seconds_bucket{{{label},le="+Inf"}} {histogram.count}',
+            f'indexer_parse_duration_seconds_sum{{{label}}} {histogram.sum:.6f}',
+            f'indexer_parse_duration_seconds_count{{{label}}} {histogram.count}',
+        ]
+        for name, value in self.gauges.items():
+            lines += [
+                f'# HELP indexer_{name} {GAUGE_HELP.get(name, name)}',
+                f'# TYPE indexer_{name} gauge',
+                f'indexer_{name}{{{label}}} {value}',
+            ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, textfile=None, pushgateway=None):
+        """
+        Logs the summary and writes the metrics to the configured textfile
+        and pushgateway. Export errors are logged, not raised.
+        """
+        textfile = textfile or METRICS_TEXTFILE
+        pushgateway = pushgateway or METRICS_PUSHGATEWAY
+        logging.info(f'Run metrics: {self.summary()}')
+
+        if textfile and self.site is not None:
+            # one file per site, e. g. indexer-docs.prom
+            root, ext = os.path.splitext(textfile)
+            textfile = f'{root}-{self.site}{ext}'
+
+        text = self.render()
+        if textfile:
+            try:
+                tmp_path = f'{textfile}.{os.getpid()}.tmp'
+                with open(tmp_path, "w") as f:
+                    f.write(text)
+                os.replace(tmp_path, textfile)
+            except OSError as e:
+                logging.warning(f'Could not write metrics to {textfile}: {e}')
+        if pushgateway:
+            url = f'{pushgateway.rstrip("/")}/metrics/job/docs-indexer/indexer/{self.indexer}'
+            if self.site is not None:
+                url += f'/site/{self.site}'
+            try:
+                response = urllib3.request(
+                    "PUT", url, body=text.encode(),
+                    headers={"Content-Type": "text/plain; version=0.0.4"},
+                    timeout=10, retries=2)
+                if response.status >= 300:
+                    logging.warning(f'Could not push metrics to {url}: status {response.status}')
+            except urllib3.exceptions.HTTPError as e:
+                logging.warning(f'Could not push metrics to {url}: {e}')
+
+
+# The run started last, and the run started by each thread
+_current = Metrics("none")
+_thread_runs = threading.local()
+
+
+def start(indexer, site=None):
+    """
+    Starts recording the metrics of a new run and returns them. The run is
+    the current one for the calling thread, and for threads that didn't
+    start a run of their own.
+    """
+    global _current
+    _current = _thread_runs.run = Metrics(indexer, site)
+    return _current
+
+
+def current():
+    """
+    Returns the metrics of the current run
+    """
+    return getattr(_thread_runs, "run", _current)
+
+
+def stage(name):
+    return current().stage(name)
+
+
+def inc(name, value=1):
+    current().inc(name, value)
+
+
+def gauge(name, value):
+    current().gauge(name, value)
+
+
+def observe_parse(seconds):
+    current().observe_parse(seconds)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import metrics
+
+
+class FakePushgateway:
+    """Local stand-in for a Pushgateway, records PUT requests."""
+
+    def __init__(self):
+        self.requests = []
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                gateway.requests.append((self.path, self.headers["Content-Type"], body.decode()))
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self.httpd = HTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _run(self):
+        run = metrics.start("hugo")
+        with metrics.stage("clone"):
+            pass
+        with metrics.stage("index"):
+            pass
+        run.stages["index"] = 2.0
+        metrics.inc("documents_indexed", 10)
+        metrics.inc("documents_failed", 1)
+        metrics.inc("parsed_bytes", 2048)
+        metrics.gauge("github_rate_limit_remaining", 4000)
+        for seconds in (0.002, 0.003, 0.004, 0.2):
+            metrics.observe_parse(seconds)
+        return run
+
+    def test_summary(self):
+        run = self._run()
+        self.assertIs(metrics.current(), run)
+        summary = run.summary()
+        self.assertIn("clone 0.00s, index 2.00s", summary)
+        self.assertIn("10 documents indexed, 1 failed, 5.0 docs/s", summary)
+        self.assertIn("4 parsed", summary)
+        self.assertIn("p50 <= 5 ms", summary)
+        self.assertIn("p95 <= 250 ms", summary)
+
+    def test_render(self):
+        text = self._run().render()
+        self.assertIn('indexer_stage_duration_seconds{indexer="hugo",stage="index"} 2.000000\n', text)
+        self.assertIn('indexer_documents{indexer="hugo",result="failed"} 1\n', text)
+        self.assertIn('indexer_documents_per_second{indexer="hugo"} 5.000\n', text)
+        self.assertIn('indexer_parse_duration_seconds_bucket{indexer="hugo",le="0.0025"} 1\n', text)
+        self.assertIn('indexer_parse_duration_seconds_bucket{indexer="hugo",le="0.005"} 3\n', text)
+        self.assertIn('indexer_parse_duration_seconds_bucket{indexer="hugo",le="+Inf"} 4\n', text)
+        self.assertIn('indexer_parse_duration_seconds_count{indexer="hugo"} 4\n', text)
+        self.assertIn('# TYPE indexer_github_rate_limit_remaining gauge\n'
+                      'indexer_github_rate_limit_remaining{indexer="hugo"} 4000\n', text)
+
+    def test_export(self):
+        run = self._run()
+        textfile = os.path.join(self.tmpdir, "indexer.prom")
+
+        with FakePushgateway() as gateway:
+            with self.assertLogs(level="INFO") as logs:
+                run.export(textfile=textfile, pushgateway=gateway.url + "/")
+
+        with open(textfile) as f:
+            self.assertEqual(f.read(), run.render())
+        self.assertEqual(os.listdir(self.tmpdir), ["indexer.prom"])
+        self.assertEqual(gateway.requests, [
+            ("/metrics/job/docs-indexer/indexer/hugo", "text/plain; version=0.0.4", run.render()),
+        ])
+        self.assertIn("Run metrics: stages: clone", logs.output[0])
+
+    def test_site_runs(self):
+        run = self._run()
+        site_run = metrics.start("hugo", site="docs")
+        metrics.inc("documents_indexed", 3)
+        self.assertIs(metrics.current(), site_run)
+        self.assertIn('indexer_documents{indexer="hugo",site="docs",result="success"} 3\n', site_run.render())
+
+        # other threads record into the run they started
+        def other():
+            metrics.start("hugo", site="handbook")
+            metrics.inc("documents_indexed", 5)
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        self.assertEqual(site_run.counters["documents_indexed"], 3)
+        self.assertEqual(run.counters["documents_indexed"], 10)
+
+        with FakePushgateway() as gateway:
+            with self.assertLogs(level="INFO"):
+                site_run.export(textfile=os.path.join(self.tmpdir, "indexer.prom"), pushgateway=gateway.url)
+        self.assertEqual(os.listdir(self.tmpdir), ["indexer-docs.prom"])
+        self.assertEqual(gateway.requests[0][0], "/metrics/job/docs-indexer/indexer/hugo/site/docs")
+
+    def test_export_errors_are_logged(self):
+        run = self._run()
+        with self.assertLogs(level="WARNING") as logs:
+            run.export(textfile=os.path.join(self.tmpdir, "missing", "indexer.prom"),
+                       pushgateway="http://127.0.0.1:1")
+        errors = [line for line in logs.output if "Could not" in line]
+        self.assertEqual(len(errors), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import sites
+
+
+class TestSites(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _write(self, text):
+        path = os.path.join(self.tmpdir, "sites.yaml")
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_from_env(self):
+        site = sites.SiteConfig.from_env({
+            "INDEX_NAME": "docs", "REPOSITORY_HANDLE": "org/docs", "INCREMENTAL": "true",
+            "INCREMENTAL_MAX_CHANGES": "10", "REUSE_CLONE": "false",
+        })
+        self.assertEqual(site.index_name, "docs")
+        self.assertEqual(site.repository_branch, "main")
+        self.assertTrue(site.incremental)
+        self.assertEqual(site.incremental_max_changes, 10)
+        self.assertFalse(site.reuse_clone)
+        self.assertEqual(site.branch_head_url, "https://api.github.com/repos/org/docs/commits/main")
+        self.assertEqual(site.main_path, f'{sites.SOURCE_PATH}/docs')
+        self.assertEqual(site.etag_path, f'{sites.WORKDIR}/etag/docs.json')
+
+    @mock.patch.dict(os.environ, {"INDEX_NAME": "ignored", "TYPE_LABEL": "Documentation", "GITHUB_TOKEN": "t"})
+    def test_load_sites(self):
+        path = self._write(
+            "- index_name: docs\n"
+            "  repository_handle: org/docs\n"
+            "  repository_subfolder: src/content\n"
+            "- {index_name: handbook, repository_handle: org/handbook, type_label: Handbook, incremental: true}\n")
+        docs, handbook = sites.load_sites(path)
+        self.assertEqual((docs.index_name, docs.repository_subfolder, docs.type_label), ("docs", "src/content", "Documentation"))
+        self.assertEqual((handbook.index_name, handbook.type_label, handbook.incremental), ("handbook", "Handbook", True))
+        self.assertEqual(handbook.github_token, "t")
+
+    def test_load_sites_errors(self):
+        for text in ("index_name: docs\n",
+                     "- {index_name: docs}\n",
+                     "- {index_name: docs, repository_handle: org/docs, colour: red}\n",
+                     "- {index_name: docs, repository_handle: org/docs}\n"
+                     "- {index_name: docs2, repository_handle: org/docs}\n"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                sites.load_sites(self._write(text))
+
+
+if __name__ == '__main__':
+    unittest.main()